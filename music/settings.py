@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
 import os
+import pathlib
 import sys
 
 
@@ -87,7 +88,34 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Seconds a connection is kept open across requests.
+        'CONN_MAX_AGE': 60,
+    },
+    # Read-only connection to the same file, serving the reads of the
+    # catalog endpoints, see `mutecloud.routers`.
+    'catalog': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': pathlib.Path(BASE_DIR, 'db.sqlite3').as_uri() + '?mode=ro',
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['mutecloud.routers.CatalogRouter']
+
+# Pragmas run on every new SQLite connection, see `mutecloud.database`, in
+# order. WAL lets reads run alongside the single writer, `busy_timeout`
+# (milliseconds) makes a blocked writer wait rather than fail with
+# "database is locked", and NORMAL synchronous is safe in WAL mode. A
+# negative `cache_size` is in KiB, `mmap_size` is in bytes. An empty dict
+# keeps the SQLite defaults. Compare both with
+# `python manage.py benchmark_concurrency`.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -65536,
+    'mmap_size': 268435456,
 }
 
 
@@ -118,6 +146,32 @@ REST_FRAMEWORK = {
     # )
 }
 
+# Seconds between two writes of buffered song and album ratings. None
+# writes every rating through to the database as it arrives.
+RATINGS_WRITE_BEHIND_INTERVAL = None
+
+# The local memory cache is per process, with several worker processes use
+# a shared backend such as
+# 'django.core.cache.backends.filebased.FileBasedCache' instead.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mutecloud-responses',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Render song and album details and album lists straight from `.values()`
+# rows, see `mutecloud.fastpath`. The output is the same either way.
+FAST_SERIALIZERS = True
+
+# Cache alias and lifetime (seconds) of cached API responses.
+RESPONSE_CACHE = 'responses'
+RESPONSE_CACHE_TIMEOUT = 300
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.1/topics/i18n/
@@ -10,6 +10,7 @@ router.register(r'genres', views.GenreViewSet)
 router.register(r'playlists', views.PlaylistViewSet)
 router.register(r'recommendations', views.RecommendationViewSet)
 router.register(r'artists', views.ArtistViewSet)
+router.register(r'export', views.ExportViewSet, basename='export')
 
 # Wire up our API using automatic URL routing.
 # Additionally, we include login URLs for the browsable API.
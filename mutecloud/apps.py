@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class MutecloudConfig(AppConfig):
     name = 'mutecloud'
+
+    def ready(self):
+        # Keeps the search index in step with catalog edits.
+        from mutecloud import signals  # noqa: F401
+        # Applies the SQLite pragmas of the settings to new connections.
+        from mutecloud import database  # noqa: F401
@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from mutecloud.database import chunks
+from mutecloud.models import Song, Artist, SongCard
+
+
+CHUNK_SIZE = 500
+
+
+def song_cards(song_ids):
+    """Build the cards of the given songs, in three queries."""
+    songs = Song.objects.filter(id__in=song_ids).values_list(
+        'id', 'name', 'album_id', 'album__name', 'released_on',
+        'song_length', 'rating', 'reviewers')
+    genres = {}
+    artists = {}
+
+    for song_id, genre_id, genre_name in Song.genres.through.objects.filter(
+            song_id__in=song_ids).order_by('genre_id').values_list(
+                'song_id', 'genre_id', 'genre__name'):
+        genres.setdefault(song_id, []).append([genre_id, genre_name])
+
+    for song_id, artist_id, artist_name in Artist.songs.through.objects.filter(
+            song_id__in=song_ids).order_by('artist_id').values_list(
+                'song_id', 'artist_id', 'artist__name'):
+        artists.setdefault(song_id, []).append([artist_id, artist_name])
+
+    return [
+        SongCard(song_id=song_id, name=name, album_id=album_id,
+                 album_name=album_name, genres=genres.get(song_id, []),
+                 artists=artists.get(song_id, []), released_on=released_on,
+                 song_length=song_length, rating=rating, reviewers=reviewers)
+        for (song_id, name, album_id, album_name, released_on, song_length,
+             rating, reviewers) in songs]
+
+
+@transaction.atomic
+def refresh_cards(song_ids):
+    """Rewrite the cards of the given songs, dropping those of deleted ones."""
+    for chunk in chunks(set(song_ids), CHUNK_SIZE):
+        SongCard.objects.filter(song_id__in=chunk).delete()
+        SongCard.objects.bulk_create(song_cards(chunk))
+
+
+def refresh_ratings(song_ids):
+    """Copy the ratings of the given songs onto their cards, one UPDATE
+    per chunk.
+    """
+    songs = Song.objects.filter(id=OuterRef('song_id'))
+
+    for chunk in chunks(set(song_ids), CHUNK_SIZE):
+        SongCard.objects.filter(song_id__in=chunk).update(
+            rating=Subquery(songs.values('rating')),
+            reviewers=Subquery(songs.values('reviewers')))
+
+
+@transaction.atomic
+def rebuild_cards(batch_size=CHUNK_SIZE):
+    """Rewrite every card, `batch_size` songs at a time. Returns the number
+    of cards written.
+    """
+    written = 0
+    last_id = 0
+    SongCard.objects.all().delete()
+
+    while True:
+        song_ids = list(Song.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True)[:batch_size])
+
+        if not song_ids:
+            break
+
+        SongCard.objects.bulk_create(song_cards(song_ids))
+        written += len(song_ids)
+        last_id = song_ids[-1]
+
+    return written
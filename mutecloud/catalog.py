@@ -0,0 +1,58 @@
+from django.db.models import F
+from django.utils import timezone
+
+from mutecloud.models import CatalogVersion
+
+
+CATALOG_VERSION_ID = 1
+
+
+def catalog_version(using=None):
+    """Current version of the song catalog, 0 before its first change."""
+    return CatalogVersion.objects.using(using).filter(
+        id=CATALOG_VERSION_ID).values_list('version', flat=True).first() or 0
+
+
+def bump_catalog_version(using=None):
+    """Mark the catalog as changed, in the caller's transaction."""
+    updated = CatalogVersion.objects.using(using).filter(
+        id=CATALOG_VERSION_ID).update(
+            version=F('version') + 1, updated_on=timezone.now())
+
+    if not updated:
+        CatalogVersion.objects.using(using).get_or_create(
+            id=CATALOG_VERSION_ID, defaults={'version': 1})
+
+
+def bump_ratings_version(using=None):
+    """Mark the song or album ratings as changed, in the caller's
+    transaction. The catalog version is left alone.
+    """
+    now = timezone.now()
+    updated = CatalogVersion.objects.using(using).filter(
+        id=CATALOG_VERSION_ID).update(
+            ratings_version=F('ratings_version') + 1, ratings_updated_on=now)
+
+    if not updated:
+        CatalogVersion.objects.using(using).get_or_create(
+            id=CATALOG_VERSION_ID,
+            defaults={'ratings_version': 1, 'ratings_updated_on': now})
+
+
+def catalog_state(using=None, ratings=False):
+    """Version and time of the last change of the song catalog, one query.
+
+    With `ratings`, a change of the ratings counts too, and the version is
+    a `<catalog>.<ratings>` string.
+    """
+    version, updated_on, ratings_version, ratings_updated_on = (
+        CatalogVersion.objects.using(using).filter(
+            id=CATALOG_VERSION_ID).values_list(
+                'version', 'updated_on', 'ratings_version',
+                'ratings_updated_on').first() or (0, None, 0, None))
+
+    if not ratings:
+        return version, updated_on
+
+    return '%d.%d' % (version, ratings_version), max(
+        filter(None, (updated_on, ratings_updated_on)), default=None)
@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from mutecloud.models import CatalogVersion
+
+
+# Pragmas that change the database file, left to writable connections.
+FILE_PRAGMAS = {'journal_mode'}
+
+# Ids per IN (...) lookup, under the SQLite limit on query parameters.
+ID_CHUNK_SIZE = 500
+
+# Writes nothing, but takes the write lock of the transaction.
+WRITE_LOCK_SQL = 'UPDATE %s SET version = version WHERE 0' % (
+    CatalogVersion._meta.db_table)
+
+
+def chunks(items, size=ID_CHUNK_SIZE):
+    """Lists of at most `size` consecutive items of `items`."""
+    items = list(items)
+
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def apply_pragmas(connection, pragmas):
+    """Run `PRAGMA name = value` on a DB-API connection, in the order of
+    `pragmas`.
+    """
+    for name, value in pragmas.items():
+        connection.execute('PRAGMA %s = %s' % (name, value))
+
+
+def is_read_only(connection):
+    """Whether a SQLite connection was opened with a `mode=ro` URI."""
+    name = str(connection.settings_dict['NAME'])
+
+    return name.startswith('file:') and 'ro' in parse_qs(
+        urlsplit(name).query).get('mode', ())
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply `SQLITE_PRAGMAS` to every new SQLite connection.
+
+    Run on the raw connection, so they are never counted as queries.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = settings.SQLITE_PRAGMAS
+
+    if is_read_only(connection):
+        pragmas = {name: value for name, value in pragmas.items()
+                   if name not in FILE_PRAGMAS}
+
+    apply_pragmas(connection.connection, pragmas)
+
+
+@contextmanager
+def write_transaction(using=None):
+    """`transaction.atomic()` holding the SQLite write lock from the start.
+
+    A SQLite transaction that reads before it writes cannot wait for the
+    lock: when another connection committed in between, its first write
+    fails at once with "database is locked", whatever the `busy_timeout`.
+    Taking the lock first makes it wait its turn instead. Also a decorator.
+    """
+    connection = transaction.get_connection(using)
+    outermost = not connection.in_atomic_block
+
+    with transaction.atomic(using=using):
+        if outermost and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(WRITE_LOCK_SQL)
+
+        yield
@@ -0,0 +1,99 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from mutecloud.models import (Song, Genre, Playlist, Album, Recommendation,
+                              Artist, PlaylistTrack)
+
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+# Rows fetched per round trip, which bounds the memory of an export.
+CHUNK_SIZE = 2000
+
+
+def _line(record_type, record):
+    return json.dumps(
+        dict(type=record_type, **record), cls=DjangoJSONEncoder) + '\n'
+
+
+def _rows(queryset, *fields):
+    return queryset.order_by('id').values(*fields).iterator(
+        chunk_size=CHUNK_SIZE)
+
+
+def _links(queryset, owner, related, *ordering):
+    """(owner id, related id) pairs of a relation, grouped by owner."""
+    return queryset.order_by(owner, *(ordering or (related,))).values_list(
+        owner, related).iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Merge:
+    """Walks relation pairs alongside owner rows read in the same order, so
+    neither side is ever held in memory as a whole.
+    """
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+        self.head = next(pairs, None)
+
+    def take(self, owner_id):
+        related = []
+
+        while self.head is not None and self.head[0] <= owner_id:
+            if self.head[0] == owner_id:
+                related.append(self.head[1])
+
+            self.head = next(self.pairs, None)
+
+        return related
+
+
+def _records(record_type, rows, **relations):
+    relations = {name: _Merge(pairs) for name, pairs in relations.items()}
+
+    for row in rows:
+        for name, merge in relations.items():
+            row[name] = merge.take(row['id'])
+
+        yield _line(record_type, row)
+
+
+def catalog_lines():
+    """The whole catalog as NDJSON lines: genres, albums, songs, artists.
+
+    Relations are listed as ids.
+    """
+    yield from _records('genre', _rows(Genre.objects, 'id', 'name'))
+    yield from _records(
+        'album',
+        _rows(Album.objects, 'id', 'name', 'rating', 'reviewers',
+              'released_on', 'album_length'),
+        genres=_links(Album.genres.through.objects, 'album_id', 'genre_id'))
+    yield from _records(
+        'song',
+        _rows(Song.objects, 'id', 'name', 'album', 'rating', 'reviewers',
+              'released_on', 'song_length'),
+        genres=_links(Song.genres.through.objects, 'song_id', 'genre_id'))
+    yield from _records(
+        'artist',
+        _rows(Artist.objects, 'id', 'name'),
+        albums=_links(Artist.albums.through.objects, 'artist_id', 'album_id'),
+        songs=_links(Artist.songs.through.objects, 'artist_id', 'song_id'),
+        genres=_links(Artist.genres.through.objects, 'artist_id', 'genre_id'))
+
+
+def library_lines(user):
+    """The playlists, with their songs in order, and the received
+    recommendations of `user` as NDJSON lines.
+    """
+    yield from _records(
+        'playlist',
+        _rows(Playlist.objects.filter(user=user), 'id', 'name', 'created_on',
+              'rules'),
+        songs=_links(PlaylistTrack.objects.filter(playlist__user=user),
+                     'playlist_id', 'song_id', 'position', 'id'))
+    yield from _records(
+        'recommendation',
+        _rows(Recommendation.objects.filter(for_user=user), 'id', 'from_user',
+              'song', 'album', 'genre', 'artist', 'recommended_on'))
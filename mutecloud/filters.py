@@ -0,0 +1,163 @@
+import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from mutecloud.models import Song, Album, Artist
+
+
+ORDERING_PARAM = 'ordering'
+
+
+def _id(value):
+    pk = int(value)
+
+    if pk < 1:
+        raise ValueError(value)
+
+    return pk
+
+
+def _rating(value):
+    rating = int(value)
+
+    if rating not in Song.Score.values:
+        raise ValueError(value)
+
+    return rating
+
+
+def _seconds(value):
+    seconds = int(value)
+
+    if seconds < 0:
+        raise ValueError(value)
+
+    return seconds
+
+
+# param -> (parse value, column key, lookup), where the column key is looked
+# up in `ListFilter.columns`.
+COLUMN_FILTERS = {
+    'rating': (_rating, 'rating', 'exact'),
+    'released_after': (datetime.date.fromisoformat, 'released_on', 'gte'),
+    'released_before': (datetime.date.fromisoformat, 'released_on', 'lte'),
+    'min_length': (_seconds, 'length', 'gte'),
+    'max_length': (_seconds, 'length', 'lte'),
+}
+
+FILTER_ERRORS = {
+    'genre': 'Must be a genre id.',
+    'artist': 'Must be an artist id.',
+    'rating': 'Must be an integer from %d to %d.' % (
+        min(Song.Score.values), max(Song.Score.values)),
+    'released_after': 'Must be a date, YYYY-MM-DD.',
+    'released_before': 'Must be a date, YYYY-MM-DD.',
+    'min_length': 'Must be a number of seconds.',
+    'max_length': 'Must be a number of seconds.',
+}
+
+
+class ListFilter:
+    """Filters and sorts a catalog list from its query parameters.
+
+    `genre` and `artist` take an id, matched through the relation tables,
+    `rating` an exact score, `released_after` / `released_before` an
+    inclusive date and `min_length` / `max_length` an inclusive number of
+    seconds. `ordering` is one of `orderings`, `-` first for descending
+    order, and defaults to the column of a range filter, descending, when
+    there is one. Every supported combination of filters is backed by an
+    index of the model, see `Meta.indexes`, and every ordering ends with
+    the primary key for the keyset pagination.
+    """
+    pk = 'id'
+    # Column key -> model field.
+    columns = {}
+    # param -> (through model, column of the listed object, column of the
+    # param).
+    relations = {}
+    # `ordering` value -> ordering fields, before the primary key.
+    orderings = {}
+    default_ordering = ()
+
+    def __init__(self, params):
+        self.lookups = Q()
+
+        for param, (through, own, other) in self.relations.items():
+            if param in params:
+                self.lookups &= Q(pk__in=through.objects.filter(**{
+                    other: self.parse(params, param, _id)}).values(own))
+
+        ranges = []
+
+        for param, (parse, column, lookup) in COLUMN_FILTERS.items():
+            if param in params:
+                self.lookups &= Q(**{'%s__%s' % (
+                    self.columns[column], lookup): self.parse(
+                        params, param, parse)})
+
+                if lookup != 'exact':
+                    ranges.append(column)
+
+        ordering = params.get(ORDERING_PARAM)
+
+        if ordering is None and ranges:
+            # Read the range in the order of its index, rather than letting
+            # SQLite walk the whole default ordering to fill a page.
+            ordering = '-' + ranges[0]
+
+        if ordering is None:
+            self.ordering = self.default_ordering
+        elif ordering.lstrip('-') in self.orderings:
+            prefix = '-' if ordering.startswith('-') else ''
+            fields = self.orderings[ordering.lstrip('-')] + (self.pk,)
+            self.ordering = [prefix + field for field in fields]
+        else:
+            raise ValidationError({ORDERING_PARAM: 'Must be one of %s.' % (
+                ', '.join(sorted(self.orderings)))})
+
+    def parse(self, params, param, parse):
+        try:
+            return parse(params[param])
+        except ValueError:
+            raise ValidationError({param: FILTER_ERRORS[param]})
+
+    def filter(self, queryset):
+        return queryset.filter(self.lookups).order_by(*self.ordering)
+
+
+class SongListFilter(ListFilter):
+    pk = 'song_id'
+    columns = {
+        'rating': 'rating',
+        'released_on': 'released_on',
+        'length': 'song_length',
+    }
+    relations = {
+        'genre': (Song.genres.through, 'song_id', 'genre_id'),
+        'artist': (Artist.songs.through, 'song_id', 'artist_id'),
+    }
+    orderings = {
+        'rating': ('rating', 'released_on'),
+        'released_on': ('released_on',),
+        'length': ('song_length',),
+    }
+    default_ordering = ('-song_id',)
+
+
+class AlbumListFilter(ListFilter):
+    columns = {
+        'rating': 'rating',
+        'released_on': 'released_on',
+        'length': 'album_length',
+    }
+    relations = {
+        'genre': (Album.genres.through, 'album_id', 'genre_id'),
+        'artist': (Artist.albums.through, 'album_id', 'artist_id'),
+    }
+    orderings = {
+        'rating': ('rating', 'released_on'),
+        'released_on': ('released_on',),
+        'length': ('album_length',),
+    }
+    default_ordering = ('-released_on', '-id')
@@ -0,0 +1,394 @@
+import csv
+import json
+
+import yaml
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+
+from mutecloud import cards, search, smart_playlists
+from mutecloud.catalog import bump_catalog_version
+from mutecloud.database import chunks
+from mutecloud.models import Song, Genre, Album, Artist
+
+
+BATCH_SIZE = 1000
+
+# Separates the ids of a relation in a CSV cell, e.g. `2;6`.
+CSV_LIST_SEPARATOR = ';'
+
+CATALOG_MODELS = {
+    'genre': Genre,
+    'album': Album,
+    'song': Song,
+    'artist': Artist,
+}
+RECORD_TYPES = {model: name for name, model in CATALOG_MODELS.items()}
+RELATIONS = {
+    'album': ('genres',),
+    'song': ('genres',),
+    'artist': ('albums', 'songs', 'genres'),
+}
+
+# Past this share of the catalog, the search index and the song cards are
+# rebuilt from scratch rather than refreshed song by song.
+REBUILD_RATIO = 0.5
+
+
+class IngestError(ValueError):
+    """A catalog record that cannot be ingested."""
+
+    @classmethod
+    def at(cls, line, message):
+        """The error of a record read from `line` of the file, if known."""
+        return cls(message if line is None else 'Line %d: %s' % (
+            line, message))
+
+
+def _fixture_record(item):
+    """Records in the layout of `loaddata` fixtures become flat records."""
+    if 'model' in item:
+        return dict(item.get('fields', {}),
+                    type=item['model'].rpartition('.')[2], id=item.get('pk'))
+
+    return item
+
+
+def read_yaml(stream):
+    """(line, record) of a YAML fixture, composed one list item at a
+    time.
+    """
+    loader = yaml.SafeLoader(stream)
+
+    try:
+        loader.get_event()
+
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+
+        loader.get_event()
+
+        if not loader.check_event(yaml.SequenceStartEvent):
+            raise IngestError('A YAML catalog must be a list of records.')
+
+        loader.get_event()
+
+        while not loader.check_event(yaml.SequenceEndEvent):
+            node = loader.compose_node(None, None)
+            yield node.start_mark.line + 1, _fixture_record(
+                loader.construct_document(node))
+    finally:
+        loader.dispose()
+
+
+def read_ndjson(stream):
+    """(line, record) of a JSON file holding one record per line, such as
+    the output of `export_ndjson`.
+    """
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                record = _fixture_record(json.loads(line))
+            except ValueError as error:
+                raise IngestError.at(number, error)
+
+            yield number, record
+
+
+def read_csv(stream):
+    """(line, record) of a CSV file with a `type` and an `id` column.
+    Relations are `;` separated ids, and empty cells are left out.
+    """
+    reader = csv.DictReader(stream)
+
+    for row in reader:
+        record = {name: value for name, value in row.items() if value != ''}
+        relations = RELATIONS.get(record.get('type'), ())
+
+        for name in relations:
+            if name in record:
+                record[name] = [
+                    pk for pk in record[name].split(CSV_LIST_SEPARATOR)
+                    if pk.strip()]
+
+        yield reader.line_num, record
+
+
+READERS = {
+    'yaml': read_yaml,
+    'json': read_ndjson,
+    'csv': read_csv,
+}
+
+
+class CatalogIngest:
+    """Upserts catalog records in batches.
+
+    Records are buffered per model and written `batch_size` at a time: new
+    objects with one `bulk_create`, existing ones with one `bulk_update`
+    per set of given fields. Listed relations replace the stored ones,
+    through one DELETE and one bulk INSERT into the through table. No
+    signal is sent, so `finish()` then refreshes the search index, the
+    song cards and the smart playlists of every song affected. Run it in a
+    single transaction: foreign keys are only checked on commit, so records
+    may come in any order. Every value is validated by its field, and every
+    referenced id must be in the database or in the ingested records, so a
+    bad record fails with the line it was read from rather than at commit.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.pending = {name: {} for name in CATALOG_MODELS}
+        self.written = {name: set() for name in CATALOG_MODELS}
+        # Records of other models, such as the playlists of a fixture.
+        self.skipped = 0
+
+    def add(self, record, line=None):
+        """Buffer a record, read from `line` of the file for the errors."""
+        record = dict(record)
+        record_type = str(record.pop('type', '')).lower()
+
+        if record_type not in CATALOG_MODELS:
+            self.skipped += 1
+            return
+
+        try:
+            pk = int(record.pop('id'))
+        except (KeyError, TypeError, ValueError):
+            raise IngestError.at(
+                line, 'Every %s needs an integer id.' % record_type)
+
+        pending = self.pending[record_type]
+        pending[pk] = (line, record)
+
+        if len(pending) >= self.batch_size:
+            self.flush(record_type)
+
+    def flush(self, record_type):
+        model = CATALOG_MODELS[record_type]
+        records = self.pending[record_type]
+        self.pending[record_type] = {}
+
+        if not records:
+            return
+
+        relations = RELATIONS.get(record_type, ())
+        objects = {}
+        updated_fields = {}
+
+        for pk, (line, record) in records.items():
+            values = {name: record[name] for name in record
+                      if name not in relations}
+
+            try:
+                objects[pk] = self.build(model, pk, values)
+
+                for name in relations:
+                    if name in record:
+                        record[name] = self.related_ids(
+                            model, name, record[name])
+            except IngestError as error:
+                raise IngestError.at(line, error)
+
+            updated_fields.setdefault(
+                tuple(sorted(self.field_names(model, values))), []).append(pk)
+
+        existing = set()
+
+        for chunk in chunks(objects):
+            existing.update(model.objects.filter(
+                id__in=chunk).values_list('id', flat=True))
+
+        self.check_required(model, records, existing)
+        self.check_references(model, records, objects)
+        model.objects.bulk_create(
+            [obj for pk, obj in objects.items() if pk not in existing],
+            batch_size=self.batch_size)
+
+        for fields, pks in updated_fields.items():
+            changed = [objects[pk] for pk in pks if pk in existing]
+
+            if fields and changed:
+                model.objects.bulk_update(
+                    changed, fields, batch_size=self.batch_size)
+
+        for name in relations:
+            self.write_relation(model, name, {
+                pk: record[name] for pk, (_, record) in records.items()
+                if name in record})
+
+        self.written[record_type].update(records)
+
+    def build(self, model, pk, values):
+        fields = {}
+
+        for name, value in values.items():
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise IngestError('%s has no field %r.' % (
+                    model.__name__, name))
+
+            if field.many_to_many or field.one_to_many:
+                raise IngestError('%s.%s cannot be ingested.' % (
+                    model.__name__, name))
+
+            try:
+                if field.is_relation:
+                    # Checked for the whole batch by `check_references()`.
+                    value = field.to_python(value)
+                    field.run_validators(value)
+                else:
+                    # Includes the choices, and null and blank values.
+                    value = field.clean(value, None)
+            except ValidationError as error:
+                raise IngestError('%s.%s: %s' % (
+                    model.__name__, name, ' '.join(error.messages)))
+
+            fields[field.attname] = value
+
+        if 'rating_sum' not in fields and hasattr(model, 'rating_sum') and (
+                'rating' in fields and 'reviewers' in fields):
+            # Exports carry the rounded rating only.
+            fields['rating_sum'] = fields['rating'] * fields['reviewers']
+
+        return model(id=pk, **fields)
+
+    def check_required(self, model, records, existing):
+        """New rows must give every field that has no default."""
+        required = [
+            field for field in model._meta.concrete_fields
+            if not (field.primary_key or field.has_default() or field.null
+                    or field.blank)]
+
+        for pk, (line, record) in records.items():
+            if pk in existing:
+                continue
+
+            for field in required:
+                if field.name not in record and field.attname not in record:
+                    raise IngestError.at(line, 'A new %s needs its %s.' % (
+                        RECORD_TYPES[model], field.name))
+
+    def check_references(self, model, records, objects):
+        """Every id referenced by a foreign key or a relation of the batch
+        must exist, or be among the records of this ingest.
+        """
+        references = []
+
+        for field in model._meta.concrete_fields:
+            if field.many_to_one:
+                references.extend(
+                    (pk, field.name, field.related_model,
+                     [getattr(objects[pk], field.attname)])
+                    for pk, (_, record) in records.items()
+                    if field.name in record or field.attname in record)
+
+        for name in RELATIONS.get(RECORD_TYPES[model], ()):
+            references.extend(
+                (pk, name, model._meta.get_field(name).related_model,
+                 record[name])
+                for pk, (_, record) in records.items() if name in record)
+
+        wanted = {}
+
+        for _, _, related_model, pks in references:
+            wanted.setdefault(related_model, set()).update(pks)
+
+        missing = {related_model: self.missing_ids(related_model, pks)
+                   for related_model, pks in wanted.items()}
+
+        for pk, name, related_model, pks in references:
+            unknown = sorted(set(pks) & missing[related_model])
+
+            if unknown:
+                raise IngestError.at(records[pk][0], '%s.%s: no %s %s.' % (
+                    model.__name__, name, RECORD_TYPES[related_model],
+                    ', '.join(map(str, unknown))))
+
+    def missing_ids(self, model, pks):
+        """Ids of `pks` neither in the database nor among the records."""
+        record_type = RECORD_TYPES[model]
+        pks = set(pks) - self.written[record_type] - set(
+            self.pending[record_type])
+
+        for chunk in chunks(list(pks)):
+            pks.difference_update(model.objects.filter(
+                id__in=chunk).values_list('id', flat=True))
+
+        return pks
+
+    def related_ids(self, model, name, pks):
+        try:
+            return [int(pk) for pk in pks]
+        except (TypeError, ValueError):
+            raise IngestError('%s.%s must be a list of ids.' % (
+                model.__name__, name))
+
+    def field_names(self, model, values):
+        names = {model._meta.get_field(name).name for name in values}
+
+        if 'rating' in names and 'reviewers' in names and (
+                hasattr(model, 'rating_sum')):
+            names.add('rating_sum')
+
+        return names
+
+    def write_relation(self, model, name, related):
+        if not related:
+            return
+
+        field = model._meta.get_field(name)
+        through = field.remote_field.through
+        own, other = field.m2m_column_name(), field.m2m_reverse_name()
+
+        for chunk in chunks(related):
+            through.objects.filter(**{'%s__in' % own: chunk}).delete()
+
+        through.objects.bulk_create(
+            [through(**{own: pk, other: other_pk})
+             for pk, other_pks in related.items()
+             for other_pk in dict.fromkeys(other_pks)],
+            batch_size=self.batch_size, ignore_conflicts=True)
+
+    def affected_songs(self):
+        """Ids of the songs whose search rows or cards may have changed."""
+        song_ids = set(self.written['song'])
+
+        for record_type, queryset, owner in (
+                ('album', Song.objects, 'album_id'),
+                ('genre', Song.genres.through.objects, 'genre_id'),
+                ('artist', Artist.songs.through.objects, 'artist_id')):
+            column = 'id' if queryset.model is Song else 'song_id'
+
+            for chunk in chunks(self.written[record_type]):
+                song_ids.update(queryset.filter(**{
+                    '%s__in' % owner: chunk}).values_list(column, flat=True))
+
+        return song_ids
+
+    def finish(self):
+        """Write what is left, then refresh everything derived from the
+        catalog. Returns the number of records written per type.
+        """
+        for record_type in CATALOG_MODELS:
+            self.flush(record_type)
+
+        song_ids = self.affected_songs()
+
+        if len(song_ids) > Song.objects.count() * REBUILD_RATIO:
+            search.rebuild_index()
+            cards.rebuild_cards()
+        else:
+            search.index_songs(song_ids)
+            cards.refresh_cards(song_ids)
+
+        # Album and genre records change nothing smart rules refer to.
+        if self.written['song'] or self.written['artist']:
+            fields = None if self.written['song'] else {'artist'}
+
+            for chunk in chunks(song_ids):
+                smart_playlists.refresh_songs(chunk, fields)
+
+        if song_ids or any(self.written.values()):
+            bump_catalog_version()
+
+        return {name: len(pks) for name, pks in self.written.items()}
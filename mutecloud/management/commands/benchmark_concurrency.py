@@ -0,0 +1,181 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import (DEFAULT_DB_ALIAS, OperationalError,
+                       close_old_connections, connections)
+from django.test import override_settings
+
+from mutecloud import playlists
+from mutecloud.catalog import catalog_state
+from mutecloud.database import write_transaction
+from mutecloud.models import Song, Playlist, SongCard
+from mutecloud.ratings import MAX_RATING, MIN_RATING, record_ratings
+
+
+class Command(BaseCommand):
+    help = ('Runs concurrent catalog reads, ratings and playlist edits on a '
+            'copy of the database, with the SQLite defaults and then with '
+            'SQLITE_PRAGMAS and persistent connections, and compares the '
+            'throughput.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Number of concurrent clients.')
+        parser.add_argument(
+            '--seconds', type=float, default=5,
+            help='Duration of each run.')
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2,
+            help='Share of the operations that write.')
+
+    def handle(self, *args, **options):
+        database = connections.databases[DEFAULT_DB_ALIAS]
+
+        if database['ENGINE'] != 'django.db.backends.sqlite3' or (
+                not os.path.isfile(database['NAME'])):
+            raise CommandError('The default database must be a SQLite file.')
+
+        song_ids = list(Song.objects.values_list('id', flat=True))
+        playlist_ids = list(Playlist.objects.values_list('id', flat=True))
+
+        if not song_ids or not playlist_ids:
+            raise CommandError('The database needs songs and playlists.')
+
+        source = database['NAME']
+        profiles = (
+            ('SQLite defaults', {}, 0),
+            ('Performance profile', settings.SQLITE_PRAGMAS,
+             database['CONN_MAX_AGE']),
+        )
+        results = []
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name, pragmas, max_age in profiles:
+                # A fresh copy per run. The backup keeps the journal mode
+                # of the source, which sticks to the file, so each copy
+                # gets the one of its profile, rollback journal by default.
+                copy = os.path.join(directory, '%d.sqlite3' % len(results))
+                self.copy_database(
+                    source, copy, pragmas.get('journal_mode', 'DELETE'))
+                result = self.run(
+                    database, copy, pragmas, max_age, song_ids, playlist_ids,
+                    options)
+                results.append(result)
+                self.stdout.write(
+                    '%s: %.0f ops/s (%d reads, %d writes), %d locked, '
+                    'p95 read %.1f ms, p95 write %.1f ms' % (
+                        name, result['ops'] / options['seconds'],
+                        result['reads'], result['writes'], result['locked'],
+                        result['p95_read'] * 1000,
+                        result['p95_write'] * 1000))
+
+        before, after = results
+        self.stdout.write('Throughput: %.1fx' % (
+            after['ops'] / max(before['ops'], 1)))
+
+    def copy_database(self, source, target, journal_mode):
+        source = sqlite3.connect(source)
+        target_connection = sqlite3.connect(target)
+
+        try:
+            source.backup(target_connection)
+            target_connection.execute(
+                'PRAGMA journal_mode = %s' % journal_mode)
+        finally:
+            source.close()
+            target_connection.close()
+
+    def run(self, database, path, pragmas, max_age, song_ids, playlist_ids,
+            options):
+        saved = {key: database[key] for key in ('NAME', 'CONN_MAX_AGE')}
+        connections[DEFAULT_DB_ALIAS].close()
+        database.update(NAME=path, CONN_MAX_AGE=max_age)
+        counts = {'reads': [], 'writes': [], 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+
+        def client(seed):
+            rng = random.Random(seed)
+            reads, writes, locked = [], [], 0
+
+            while time.monotonic() < deadline:
+                write = rng.random() < options['write_ratio']
+                start = time.perf_counter()
+
+                try:
+                    if write:
+                        self.write(rng, song_ids, playlist_ids)
+                    else:
+                        self.read(rng)
+                except OperationalError:
+                    locked += 1
+                else:
+                    (writes if write else reads).append(
+                        time.perf_counter() - start)
+                finally:
+                    # The end of a request, which closes the connection
+                    # unless it is persistent.
+                    close_old_connections()
+
+            connections[DEFAULT_DB_ALIAS].close()
+
+            with lock:
+                counts['reads'].extend(reads)
+                counts['writes'].extend(writes)
+                counts['locked'] += locked
+
+        try:
+            with override_settings(SQLITE_PRAGMAS=pragmas):
+                threads = [threading.Thread(target=client, args=(seed,))
+                           for seed in range(options['threads'])]
+
+                for thread in threads:
+                    thread.start()
+
+                for thread in threads:
+                    thread.join()
+        finally:
+            database.update(saved)
+
+        return {
+            'ops': len(counts['reads']) + len(counts['writes']),
+            'reads': len(counts['reads']),
+            'writes': len(counts['writes']),
+            'locked': counts['locked'],
+            'p95_read': self.percentile(counts['reads'], 0.95),
+            'p95_write': self.percentile(counts['writes'], 0.95),
+        }
+
+    def read(self, rng):
+        """A page of the song list, as `GET /songs/` reads it."""
+        catalog_state()
+        list(SongCard.objects.order_by('-song_id')[:10])
+
+    def write(self, rng, song_ids, playlist_ids):
+        """A song rating or a playlist edit, as the API makes them."""
+        song_id = rng.choice(song_ids)
+
+        if rng.random() < 0.5:
+            record_ratings(Song, {song_id: (
+                rng.randint(MIN_RATING, MAX_RATING), 1)})
+        else:
+            playlist = Playlist(id=rng.choice(playlist_ids))
+
+            # As `PUT /playlists/<id>/edit-songs/` runs it.
+            with write_transaction():
+                if not playlists.edit_tracks(playlist, remove=[song_id])[1]:
+                    playlists.edit_tracks(playlist, add=[song_id])
+
+    def percentile(self, timings, share):
+        if not timings:
+            return 0
+
+        return sorted(timings)[min(len(timings) - 1,
+                                   int(len(timings) * share))]
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from mutecloud.fastpath import AlbumFastSerializer, SongFastSerializer
+from mutecloud.serializers import AlbumSerializer, SongSerializer
+from mutecloud.views import AlbumViewSet, SongViewSet
+
+
+class Command(BaseCommand):
+    help = ('Times the fast path serializers against the DRF ones on a page '
+            'of songs and albums, and checks they render the same bytes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size', type=int, default=100,
+            help='Number of objects serialized per run.')
+        parser.add_argument(
+            '--runs', type=int, default=50,
+            help='Number of timed runs of each serializer.')
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def handle(self, *args, **options):
+        request = Request(RequestFactory().get('/'))
+        renderer = JSONRenderer()
+        size = options['page_size']
+
+        for name, queryset, serializer, fast in (
+                ('songs', SongViewSet.queryset, SongSerializer,
+                 SongFastSerializer),
+                ('albums', AlbumViewSet.queryset, AlbumSerializer,
+                 AlbumFastSerializer)):
+
+            def drf():
+                return renderer.render(serializer(
+                    list(queryset[:size]), many=True,
+                    context={'request': request}).data)
+
+            def fast_path():
+                return renderer.render(fast(request).serialize(
+                    fast.rows(queryset)[:size]))
+
+            if drf() != fast_path():
+                raise CommandError(
+                    'The fast path renders %s differently.' % name)
+
+            timings = [self.best(run, options['runs'])
+                       for run in (drf, fast_path)]
+            self.stdout.write(
+                '%s (%d per page): DRF %.2f ms, fast path %.2f ms, '
+                '%.1fx faster' % (
+                    name, size, timings[0] * 1000, timings[1] * 1000,
+                    timings[0] / timings[1]))
+
+    def best(self, run, runs):
+        """Fastest of `runs` calls of `run`, queries included."""
+        best = None
+
+        for _ in range(runs):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        return best
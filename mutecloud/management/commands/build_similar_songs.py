@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from mutecloud import similarity
+from mutecloud.catalog import bump_catalog_version
+from mutecloud.database import write_transaction
+from mutecloud.models import SimilarSong
+from mutecloud.suggestions import SongFeatures
+
+
+BATCH_SIZE = 500
+
+class Command(BaseCommand):
+    help = ('Rebuilds the top neighbours of every song from shared playlists, '
+            'artists, genres and albums.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbours', type=int, default=similarity.NEIGHBOURS,
+            help='Number of neighbours kept per song.')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of worker processes, one per CPU by default.')
+        parser.add_argument(
+            '--shard-size', type=int, default=similarity.SHARD_SIZE,
+            help='Number of songs scored per task.')
+
+    def handle(self, *args, **options):
+        features = SongFeatures(playlists=True)
+        stored = 0
+
+        # Shards are written as the pool yields them, so only one shard of
+        # rows is ever held here.
+        with write_transaction():
+            SimilarSong.objects.all().delete()
+
+            for rows in similarity.top_neighbours(
+                    features.matrix, features.song_ids,
+                    k=options['neighbours'], workers=options['workers'],
+                    shard_size=options['shard_size']):
+                SimilarSong.objects.bulk_create(
+                    [SimilarSong(song_id=song_id, neighbour_id=neighbour_id,
+                                 rank=rank, score=score)
+                     for song_id, neighbour_id, rank, score in rows],
+                    batch_size=BATCH_SIZE)
+                stored += len(rows)
+
+            # Cached and conditional song responses depend on it too.
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Stored %d neighbours of %d songs.' % (
+                stored, len(features.song_ids))))
@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from mutecloud import export
+
+
+class Command(BaseCommand):
+    help = ('Writes the whole catalog, or the playlists and recommendations '
+            'of a user, as NDJSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', help='Username whose library is exported instead.')
+        parser.add_argument(
+            '--output', help='File written to, standard output by default.')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError('No user named %s.' % options['user'])
+
+            lines = export.library_lines(user)
+        else:
+            lines = export.catalog_lines()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
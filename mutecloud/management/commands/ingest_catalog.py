@@ -0,0 +1,60 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from mutecloud import ingest
+
+
+EXTENSIONS = {
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+    '.json': 'json',
+    '.ndjson': 'json',
+    '.jsonl': 'json',
+    '.csv': 'csv',
+}
+
+
+class Command(BaseCommand):
+    help = ('Upserts genres, albums, songs and artists from a YAML fixture, '
+            'an NDJSON file or a CSV file, in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Catalog file to ingest.')
+        parser.add_argument(
+            '--format', choices=sorted(ingest.READERS),
+            help='Format of the file, guessed from its extension by default.')
+        parser.add_argument(
+            '--batch-size', type=int, default=ingest.BATCH_SIZE,
+            help='Number of records of a model written per batch.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or EXTENSIONS.get(
+            os.path.splitext(options['path'])[1].lower())
+
+        if file_format is None:
+            raise CommandError(
+                'Cannot guess the format of %s, pass --format.' %
+                options['path'])
+
+        catalog = ingest.CatalogIngest(batch_size=options['batch_size'])
+
+        try:
+            with open(options['path'], encoding='utf-8', newline='') as stream:
+                with transaction.atomic():
+                    for line, record in ingest.READERS[file_format](
+                            stream):
+                        catalog.add(record, line)
+
+                    written = catalog.finish()
+        except (ingest.IngestError, IntegrityError) as error:
+            # Nothing was written.
+            raise CommandError(str(error))
+
+        self.stdout.write(self.style.SUCCESS('Ingested %s.' % ', '.join(
+            '%d %ss' % (count, name) for name, count in written.items())))
+
+        if catalog.skipped:
+            self.stdout.write(self.style.WARNING(
+                'Skipped %d records of other types.' % catalog.skipped))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from mutecloud import search
+from mutecloud.catalog import bump_catalog_version
+from mutecloud.database import write_transaction
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search_song full-text index from the catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=search.ID_CHUNK_SIZE,
+            help='Number of songs read and inserted per batch.')
+
+    def handle(self, *args, **options):
+        with write_transaction():
+            indexed = search.rebuild_index(batch_size=options['batch_size'])
+            # Cached search results are keyed by the catalog version.
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Indexed %d songs into search_song.' % indexed))
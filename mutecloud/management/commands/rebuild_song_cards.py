@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from mutecloud import cards
+from mutecloud.catalog import bump_catalog_version
+from mutecloud.database import write_transaction
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized song cards read by the song lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=cards.CHUNK_SIZE,
+            help='Number of songs read and inserted per batch.')
+
+    def handle(self, *args, **options):
+        with write_transaction():
+            written = cards.rebuild_cards(batch_size=options['batch_size'])
+            # Cached and conditional song lists are rendered from the cards.
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Wrote %d song cards.' % written))
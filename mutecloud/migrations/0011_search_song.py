@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0010_recommendation'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE VIRTUAL TABLE IF NOT EXISTS search_song USING FTS5 '
+                '(id, name, album_name, album_id, genre_name, genre_id, '
+                'artist_name, artist_id);',
+            reverse_sql='DROP TABLE IF EXISTS search_song;',
+        ),
+    ]
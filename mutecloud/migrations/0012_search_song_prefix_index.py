@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+COLUMNS = ('id, name, album_name, album_id, genre_name, genre_id, '
+           'artist_name, artist_id')
+
+
+def rebuild_table(options):
+    """Recreate `search_song` with `options`, keeping its rows."""
+    return [
+        'CREATE VIRTUAL TABLE search_song_rebuild USING FTS5 (%s%s);' % (
+            COLUMNS, options),
+        'INSERT INTO search_song_rebuild (%s) SELECT %s FROM search_song;' % (
+            COLUMNS, COLUMNS),
+        'DROP TABLE search_song;',
+        'ALTER TABLE search_song_rebuild RENAME TO search_song;',
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0011_search_song'),
+    ]
+
+    operations = [
+        # Prefix indexes for 2, 3 and 4 characters long prefixes keep the
+        # typeahead lookups off a scan of the whole term list.
+        migrations.RunSQL(
+            sql=rebuild_table(", prefix='2 3 4'"),
+            reverse_sql=rebuild_table(''),
+        ),
+    ]
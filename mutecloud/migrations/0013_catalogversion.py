@@ -0,0 +1,27 @@
+# Generated by Django 3.1.2 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+def create_catalog_version(apps, schema_editor):
+    CatalogVersion = apps.get_model('mutecloud', 'CatalogVersion')
+    CatalogVersion.objects.using(schema_editor.connection.alias).create(id=1)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0012_search_song_prefix_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(
+            create_catalog_version, migrations.RunPython.noop),
+    ]
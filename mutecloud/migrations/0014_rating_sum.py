@@ -0,0 +1,33 @@
+# Generated by Django 3.1.2 on 2026-10-18 19:28
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def seed_rating_sums(apps, schema_editor):
+    # The exact sums are lost, the stored averages are the best estimate.
+    for model_name in ('Album', 'Song'):
+        model = apps.get_model('mutecloud', model_name)
+        model.objects.using(schema_editor.connection.alias).update(
+            rating_sum=F('rating') * F('reviewers'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0013_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(seed_rating_sums, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.2 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0014_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['for_user', 'recommended_on'], name='recommendation_inbox'),
+        ),
+    ]
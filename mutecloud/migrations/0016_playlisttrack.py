@@ -0,0 +1,77 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+POSITION_GAP = 1 << 16
+BATCH_SIZE = 500
+
+
+def number_tracks(apps, schema_editor):
+    """Space the existing tracks of every playlist in insertion order,
+    `BATCH_SIZE` tracks at a time.
+    """
+    PlaylistTrack = apps.get_model('mutecloud', 'PlaylistTrack')
+    tracks = PlaylistTrack.objects.using(schema_editor.connection.alias)
+    # Last position given in each playlist.
+    positions = {}
+    last_id = 0
+
+    while True:
+        batch = list(tracks.filter(id__gt=last_id).order_by(
+            'id').values_list('id', 'playlist_id')[:BATCH_SIZE])
+
+        if not batch:
+            break
+
+        numbered = []
+
+        for track_id, playlist_id in batch:
+            positions[playlist_id] = positions.get(
+                playlist_id, 0) + POSITION_GAP
+            numbered.append(PlaylistTrack(
+                id=track_id, position=positions[playlist_id]))
+
+        tracks.bulk_update(numbered, ['position'], batch_size=BATCH_SIZE)
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0015_recommendation_inbox'),
+    ]
+
+    operations = [
+        # Playlist.songs keeps its table, now modelled as PlaylistTrack.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PlaylistTrack',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('playlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracks', to='mutecloud.playlist')),
+                        ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='playlist_tracks', to='mutecloud.song')),
+                    ],
+                    options={
+                        'db_table': 'mutecloud_playlist_songs',
+                        'unique_together': {('playlist', 'song')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='playlist',
+                    name='songs',
+                    field=models.ManyToManyField(db_index=True, related_name='playlists', through='mutecloud.PlaylistTrack', to='mutecloud.Song'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='playlisttrack',
+            name='position',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(number_tracks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='playlisttrack',
+            index=models.Index(fields=['playlist', 'position'], name='playlist_track_position'),
+        ),
+    ]
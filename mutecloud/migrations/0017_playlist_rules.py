@@ -0,0 +1,18 @@
+# Generated by Django 3.1.2 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0016_playlisttrack'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='rules',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
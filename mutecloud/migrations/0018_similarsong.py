@@ -0,0 +1,27 @@
+# Generated by Django 3.1.2 on 2026-10-18 19:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0017_playlist_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarSong',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_of', to='mutecloud.song')),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='mutecloud.song')),
+            ],
+            options={
+                'unique_together': {('song', 'rank')},
+            },
+        ),
+    ]
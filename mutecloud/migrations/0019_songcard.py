@@ -0,0 +1,59 @@
+# Generated by Django 3.1.2 on 2026-10-18 19:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_song_cards(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Song = apps.get_model('mutecloud', 'Song')
+    Artist = apps.get_model('mutecloud', 'Artist')
+    SongCard = apps.get_model('mutecloud', 'SongCard')
+    genres = {}
+    artists = {}
+
+    for song_id, genre_id, name in Song.genres.through.objects.using(
+            alias).order_by('genre_id').values_list(
+                'song_id', 'genre_id', 'genre__name'):
+        genres.setdefault(song_id, []).append([genre_id, name])
+
+    for song_id, artist_id, name in Artist.songs.through.objects.using(
+            alias).order_by('artist_id').values_list(
+                'song_id', 'artist_id', 'artist__name'):
+        artists.setdefault(song_id, []).append([artist_id, name])
+
+    SongCard.objects.using(alias).bulk_create([
+        SongCard(song_id=song.id, name=song.name, album_id=song.album_id,
+                 album_name=song.album.name,
+                 genres=genres.get(song.id, []),
+                 artists=artists.get(song.id, []),
+                 released_on=song.released_on, song_length=song.song_length,
+                 rating=song.rating, reviewers=song.reviewers)
+        for song in Song.objects.using(alias).select_related('album')],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0018_similarsong'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongCard',
+            fields=[
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='mutecloud.song')),
+                ('name', models.TextField()),
+                ('album_name', models.TextField()),
+                ('genres', models.JSONField(default=list)),
+                ('artists', models.JSONField(default=list)),
+                ('released_on', models.DateField()),
+                ('song_length', models.TextField()),
+                ('rating', models.IntegerField(default=0)),
+                ('reviewers', models.IntegerField(default=0)),
+                ('album', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mutecloud.album')),
+            ],
+        ),
+        migrations.RunPython(create_song_cards, migrations.RunPython.noop),
+    ]
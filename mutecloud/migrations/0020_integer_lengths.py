@@ -0,0 +1,133 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+BATCH_SIZE = 500
+
+
+def to_seconds(text):
+    """'H:MM:SS', 'M:SS' or 'SS' as seconds, 0 when unreadable."""
+    seconds = 0
+
+    try:
+        for part in (text or '').strip().split(':'):
+            seconds = seconds * 60 + int(part or 0)
+    except ValueError:
+        return 0
+
+    return max(seconds, 0)
+
+
+def to_text(seconds):
+    minutes, seconds = divmod(seconds or 0, 60)
+
+    return '%d:%02d' % (minutes, seconds)
+
+
+def convert_lengths(apps, schema_editor, convert, source, target):
+    """Convert the lengths of every song and album, `BATCH_SIZE` rows at a
+    time.
+    """
+    alias = schema_editor.connection.alias
+
+    for model_name, field in (('Song', 'song'), ('Album', 'album')):
+        model = apps.get_model('mutecloud', model_name)
+        objects = model.objects.using(alias)
+        last_id = 0
+
+        while True:
+            batch = list(objects.filter(id__gt=last_id).order_by(
+                'id').values_list('id', source % field)[:BATCH_SIZE])
+
+            if not batch:
+                break
+
+            objects.bulk_update(
+                [model(id=pk, **{target % field: convert(length)})
+                 for pk, length in batch],
+                [target % field], batch_size=BATCH_SIZE)
+            last_id = batch[-1][0]
+
+
+def lengths_to_seconds(apps, schema_editor):
+    convert_lengths(apps, schema_editor, to_seconds,
+                    '%s_length', '%s_seconds')
+
+
+def lengths_to_text(apps, schema_editor):
+    convert_lengths(apps, schema_editor, to_text,
+                    '%s_seconds', '%s_length')
+
+
+def copy_card_lengths(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Song = apps.get_model('mutecloud', 'Song')
+    SongCard = apps.get_model('mutecloud', 'SongCard')
+    SongCard.objects.using(alias).update(song_length=Subquery(
+        Song.objects.filter(id=OuterRef('song_id')).values('song_length')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0019_songcard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='song_seconds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='album_seconds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(lengths_to_seconds, lengths_to_text),
+        # A default lets the text columns be added back on reversal.
+        migrations.AlterField(
+            model_name='song',
+            name='song_length',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='album',
+            name='album_length',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='song',
+            name='song_length',
+        ),
+        migrations.RemoveField(
+            model_name='album',
+            name='album_length',
+        ),
+        migrations.RenameField(
+            model_name='song',
+            old_name='song_seconds',
+            new_name='song_length',
+        ),
+        migrations.RenameField(
+            model_name='album',
+            old_name='album_seconds',
+            new_name='album_length',
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='song_length',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='album',
+            name='album_length',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='songcard',
+            name='song_length',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(copy_card_lengths, copy_card_lengths),
+    ]
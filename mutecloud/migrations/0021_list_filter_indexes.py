@@ -0,0 +1,33 @@
+# Generated by Django 3.1.2 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0020_integer_lengths'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['rating', 'released_on', 'id'], name='album_rating_released'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['rating', 'album_length', 'id'], name='album_rating_length'),
+        ),
+        migrations.AddIndex(
+            model_name='songcard',
+            index=models.Index(fields=['released_on', 'song'], name='songcard_released'),
+        ),
+        migrations.AddIndex(
+            model_name='songcard',
+            index=models.Index(fields=['rating', 'released_on', 'song'], name='songcard_rating_released'),
+        ),
+        migrations.AddIndex(
+            model_name='songcard',
+            index=models.Index(fields=['rating', 'song_length', 'song'], name='songcard_rating_length'),
+        ),
+    ]
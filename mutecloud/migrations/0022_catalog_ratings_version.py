@@ -0,0 +1,23 @@
+# Generated by Django 3.1.2 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0021_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogversion',
+            name='ratings_updated_on',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='catalogversion',
+            name='ratings_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+def flag_smart_playlists(apps, schema_editor):
+    """Flag the playlists that already have rules."""
+    Playlist = apps.get_model('mutecloud', 'Playlist')
+    Playlist.objects.using(schema_editor.connection.alias).filter(
+        rules__isnull=False).update(is_smart=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mutecloud', '0022_catalog_ratings_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='is_smart',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(flag_smart_playlists, migrations.RunPython.noop),
+    ]
@@ -26,10 +26,22 @@ class Album(models.Model):
 
     genres = models.ManyToManyField(Genre, related_name='albums', db_index=True)
     rating = models.IntegerField(default=0, choices=Score.choices)
+    rating_sum = models.IntegerField(default=0)
     reviewers = models.IntegerField(default=0)
     name = models.TextField(db_index=True)
     released_on = models.DateField(default=datetime.date.today, db_index=True)
-    album_length = models.TextField()
+    # Seconds.
+    album_length = models.PositiveIntegerField(default=0, db_index=True)
+
+    class Meta:
+        # Serve the filters and orderings of `AlbumListFilter`, along with
+        # the single column indexes.
+        indexes = [
+            models.Index(fields=['rating', 'released_on', 'id'],
+                         name='album_rating_released'),
+            models.Index(fields=['rating', 'album_length', 'id'],
+                         name='album_rating_length'),
+        ]
 
     def __unicode__(self):
         return u'Album Name: %s' % (smart_unicode(self.name))
@@ -48,10 +60,12 @@ class Song(models.Model):
     album = models.ForeignKey(Album, related_name='songs', on_delete=models.CASCADE)
     genres = models.ManyToManyField(Genre, related_name='songs', db_index=True)
     rating = models.IntegerField(default=0, choices=Score.choices)
+    rating_sum = models.IntegerField(default=0)
     reviewers = models.IntegerField(default=0)
     name = models.TextField(db_index=True)
     released_on = models.DateField(default=datetime.date.today, db_index=True)
-    song_length = models.TextField()
+    # Seconds.
+    song_length = models.PositiveIntegerField(default=0, db_index=True)
 
     def __unicode__(self):
         return u'Song Name: %s' % (smart_unicode(self.name))
@@ -66,17 +80,120 @@ class Artist(models.Model):
     def __unicode__(self):
         return u'Artist Name: %s' % (smart_unicode(self.name))
 
+
+class SongCard(models.Model):
+    """Denormalized list row of a song, with the names of its album, genres
+    and artists. Kept in sync with the catalog by `mutecloud.cards`.
+    """
+    song = models.OneToOneField(
+        Song, primary_key=True, related_name='card', on_delete=models.CASCADE)
+    name = models.TextField()
+    album = models.ForeignKey(
+        Album, related_name='+', on_delete=models.CASCADE)
+    album_name = models.TextField()
+    # [[id, name], ...] in id order.
+    genres = models.JSONField(default=list)
+    artists = models.JSONField(default=list)
+    released_on = models.DateField()
+    song_length = models.PositiveIntegerField(default=0, db_index=True)
+    rating = models.IntegerField(default=0)
+    reviewers = models.IntegerField(default=0)
+
+    class Meta:
+        # Serve the filters and orderings of `SongListFilter`, along with
+        # the `song_length` index.
+        indexes = [
+            models.Index(fields=['released_on', 'song'],
+                         name='songcard_released'),
+            models.Index(fields=['rating', 'released_on', 'song'],
+                         name='songcard_rating_released'),
+            models.Index(fields=['rating', 'song_length', 'song'],
+                         name='songcard_rating_length'),
+        ]
+
+    def __unicode__(self):
+        return u'Song Card: %s' % (smart_unicode(self.name))
+
+
+class SimilarSong(models.Model):
+    """One of the top neighbours of a song, as computed offline by the
+    `build_similar_songs` command. `rank` 1 is the most similar.
+    """
+    song = models.ForeignKey(
+        Song, related_name='neighbours', on_delete=models.CASCADE)
+    neighbour = models.ForeignKey(
+        Song, related_name='neighbour_of', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        # Also the index serving the neighbours of a song, in rank order.
+        unique_together = [['song', 'rank']]
+
+    def __unicode__(self):
+        return u'Song: %s, Neighbour: %s, Rank: %s' % (
+            self.song_id, self.neighbour_id, self.rank)
+
+
+class CatalogVersion(models.Model):
+    """Single row counter bumped on every change of the song catalog.
+
+    Ratings change much more often than the rest of the catalog, they are
+    counted apart in `ratings_version`.
+    """
+    version = models.PositiveIntegerField(default=0)
+    updated_on = models.DateTimeField(auto_now=True)
+    ratings_version = models.PositiveIntegerField(default=0)
+    ratings_updated_on = models.DateTimeField(null=True)
+
+    def __unicode__(self):
+        return u'Catalog Version: %s' % (self.version)
+
+
 class Playlist(models.Model):
     user = models.ForeignKey(User, related_name='playlists', on_delete=models.CASCADE)
-    songs = models.ManyToManyField(Song, related_name='playlists', db_index=True)
+    songs = models.ManyToManyField(
+        Song, related_name='playlists', through='PlaylistTrack', db_index=True)
     name = models.TextField()
     created_on = models.DateField(default=datetime.date.today)
+    # Rule set of a smart playlist, see `mutecloud.smart_playlists`.
+    rules = models.JSONField(null=True, blank=True)
+    # Whether `rules` is set, so smart playlists are found by index.
+    is_smart = models.BooleanField(default=False, db_index=True)
 
     def __unicode__(self):
         return u'Playlist Name: %s, User: %s' % (
             smart_unicode(self.name), smart_unicode(self.user.username))
 
 
+class PlaylistTrack(models.Model):
+    """A song of a playlist, ordered by `position`.
+
+    Positions are spaced `POSITION_GAP` apart, so moving a track only
+    rewrites that track, to a position between its new neighbours.
+    """
+    POSITION_GAP = 1 << 16
+
+    playlist = models.ForeignKey(
+        Playlist, related_name='tracks', on_delete=models.CASCADE)
+    song = models.ForeignKey(
+        Song, related_name='playlist_tracks', on_delete=models.CASCADE)
+    position = models.BigIntegerField(default=0)
+
+    class Meta:
+        # The table of the former auto-created many to many relation.
+        db_table = 'mutecloud_playlist_songs'
+        unique_together = [['playlist', 'song']]
+        indexes = [
+            models.Index(fields=['playlist', 'position'],
+                         name='playlist_track_position'),
+        ]
+
+    def __unicode__(self):
+        return u'Playlist: %s, Song: %s, Position: %s' % (
+            self.playlist_id, self.song_id, self.position)
+
+
 class Recommendation(models.Model):
     from_user = models.ForeignKey(
         User, related_name='recommendations_sent', on_delete=models.CASCADE)
@@ -96,6 +213,14 @@ class Recommendation(models.Model):
         blank=True, null=True)
     recommended_on = models.DateField(default=datetime.date.today)
 
+    class Meta:
+        indexes = [
+            # Backs the newest first inbox of a user. SQLite appends the
+            # rowid, which is the tie-breaker of that ordering.
+            models.Index(fields=['for_user', 'recommended_on'],
+                         name='recommendation_inbox'),
+        ]
+
     def __unicode__(self):
         return u'[%s] From User: %s -> User: %s' % (
             self.recommended_on.strftime(DATE_FORMAT),
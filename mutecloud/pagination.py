@@ -0,0 +1,158 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination seeking on every field of the queryset ordering.
+
+    The ordering of the queryset must end with a unique field (`id`) that
+    breaks ties, and the cursor holds the values of all ordering fields of
+    the first or last object of a page. A page is then a range read of the
+    index backing that ordering, so page 1000 costs as much as page 1, and
+    no COUNT(*) is ever run.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.ordering = [
+            (field.lstrip('-'), field.startswith('-'))
+            for field in queryset.query.order_by]
+        position, self.reverse = self.decode_cursor(request, queryset.model)
+
+        if self.reverse:
+            queryset = queryset.reverse()
+
+        if position is not None:
+            queryset = queryset.filter(self.seek(position, self.reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = (
+            position is not None if not self.reverse else has_more)
+
+        return self.page
+
+    def seek(self, position, reverse):
+        """Filter for the rows strictly after `position`.
+
+        Written as `f1 <= v1 AND (f1 < v1 OR (f1 = v1 AND ...))`, which
+        lets the leading range condition seek into the index.
+        """
+        lookups = [
+            (name, 'lt' if descending != reverse else 'gt')
+            for name, descending in self.ordering]
+        name, lookup = lookups[-1]
+        after = Q(**{'%s__%s' % (name, lookup): position[-1]})
+
+        for (name, lookup), value in reversed(
+                list(zip(lookups[:-1], position[:-1]))):
+            after = Q(**{'%s__%s' % (name, lookup): value}) | (
+                Q(**{name: value}) & after)
+
+        name, lookup = lookups[0]
+
+        return Q(**{'%s__%se' % (name, lookup): position[0]}) & after
+
+    def position(self, instance):
+        if isinstance(instance, dict):
+            # A `.values()` row.
+            return [instance[name] for name, _ in self.ordering]
+
+        return [getattr(instance, name) for name, _ in self.ordering]
+
+    def decode_cursor(self, request, model):
+        """Position and direction of the cursor of `request`, each value
+        converted by its ordering field of `model`.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+
+        if encoded is None:
+            return None, False
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse = cursor['p'], bool(cursor.get('r'))
+
+            if not isinstance(position, list) or (
+                    len(position) != len(self.ordering)):
+                raise ValueError(position)
+
+            position = [
+                self.field_value(model, name, value)
+                for (name, _), value in zip(self.ordering, position)]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            # A tampered cursor never reaches the database.
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def field_value(self, model, name, value):
+        if value is None or isinstance(value, (list, dict)):
+            raise ValueError(value)
+
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # An annotation, compared as is.
+            return value
+
+        value = field.to_python(value)
+
+        if value is None:
+            raise ValueError(value)
+
+        return value
+
+    def encode_cursor(self, position, reverse):
+        cursor = {'p': position}
+
+        if reverse:
+            cursor['r'] = 1
+
+        encoded = urlsafe_b64encode(
+            json.dumps(cursor, cls=DjangoJSONEncoder).encode('ascii'))
+
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        if not self.page:
+            # Paged backwards past the first row, start over.
+            return remove_query_param(self.base_url, self.cursor_query_param)
+
+        return self.encode_cursor(self.position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+
+        return self.encode_cursor(self.position(self.page[0]), True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
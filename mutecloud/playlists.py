@@ -0,0 +1,104 @@
+from django.db.models import Max
+
+from mutecloud.database import chunks, write_transaction
+from mutecloud.models import PlaylistTrack
+from mutecloud.response_cache import invalidate_playlists
+
+
+GAP = PlaylistTrack.POSITION_GAP
+
+
+def edit_tracks(playlist, add=(), remove=()):
+    """Apply a membership diff to `playlist`, whatever its length.
+
+    Songs of `add` that are missing go at the end, in the given order, with
+    one bulk INSERT OR IGNORE, and the songs of `remove` go with one DELETE
+    per chunk of ids. A song listed in both is removed. Returns the song
+    ids actually added and actually removed.
+    """
+    tracks = PlaylistTrack.objects.filter(playlist=playlist)
+    remove = list(dict.fromkeys(remove))
+    removing = set(remove)
+    add = [pk for pk in dict.fromkeys(add) if pk not in removing]
+    present = set()
+
+    for chunk in chunks(add + remove):
+        present.update(tracks.filter(song_id__in=chunk).values_list(
+            'song_id', flat=True))
+
+    added = [pk for pk in add if pk not in present]
+    removed = [pk for pk in remove if pk in present]
+
+    if added:
+        last = tracks.aggregate(last=Max('position'))['last'] or 0
+        PlaylistTrack.objects.bulk_create(
+            [PlaylistTrack(playlist=playlist, song_id=pk,
+                           position=last + index * GAP)
+             for index, pk in enumerate(added, 1)],
+            ignore_conflicts=True)
+
+    for chunk in chunks(removed):
+        # Nothing references a track, a plain DELETE.
+        tracks.filter(song_id__in=chunk).delete()
+
+    if added or removed:
+        invalidate_playlists([playlist.id])
+
+    return added, removed
+
+
+def append_tracks(playlist, song_ids):
+    """Add songs at the end of `playlist`, in the given order.
+
+    Songs already in the playlist are left where they are. Returns the ids
+    of the songs added.
+    """
+    return edit_tracks(playlist, add=song_ids)[0]
+
+
+def renumber(playlist):
+    """Space every track of `playlist` `GAP` apart again, keeping order."""
+    tracks = list(PlaylistTrack.objects.filter(
+        playlist=playlist).order_by('position', 'id').only('id', 'position'))
+
+    for index, track in enumerate(tracks, 1):
+        track.position = index * GAP
+
+    PlaylistTrack.objects.bulk_update(tracks, ['position'], batch_size=500)
+
+
+@write_transaction()
+def move_track(playlist, song_id, after_song_id=None):
+    """Move a song of `playlist` right after another one, or to the top.
+
+    The track takes the position halfway between its new neighbours, so
+    only that row is written. The playlist is only renumbered once two
+    neighbours end up with no free position between them.
+    """
+    tracks = PlaylistTrack.objects.filter(playlist=playlist)
+    track = tracks.get(song_id=song_id)
+
+    if after_song_id == song_id:
+        return track
+
+    if after_song_id is None:
+        previous = 0
+    else:
+        previous = tracks.get(song_id=after_song_id).position
+
+    following = tracks.filter(position__gt=previous).exclude(
+        id=track.id).order_by('position').values_list(
+            'position', flat=True).first()
+
+    if following is None:
+        following = previous + 2 * GAP
+
+    if following - previous < 2:
+        renumber(playlist)
+        return move_track(playlist, song_id, after_song_id)
+
+    track.position = (previous + following) // 2
+    track.save(update_fields=['position'])
+    invalidate_playlists([playlist.id])
+
+    return track
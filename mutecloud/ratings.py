@@ -0,0 +1,179 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+
+from mutecloud import cards, smart_playlists
+from mutecloud.catalog import bump_ratings_version
+from mutecloud.database import write_transaction
+from mutecloud.models import Song
+
+
+logger = logging.getLogger(__name__)
+
+MIN_RATING = Song.Score.FLOP
+MAX_RATING = Song.Score.ALL_TIME
+
+
+def _add_rating(model, pk, total, count):
+    """Add `total` and `count` to the row `pk` of `model`, in one UPDATE
+    computed by SQLite from its stored sum and count. Returns the number of
+    rows updated.
+    """
+    rating_sum = F('rating_sum') + total
+    reviewers = F('reviewers') + count
+
+    return model.objects.filter(pk=pk).update(
+        rating_sum=rating_sum,
+        reviewers=reviewers,
+        # Integer division rounding half up: (2s + n) / 2n.
+        rating=(rating_sum * 2 + reviewers) / (reviewers * 2))
+
+
+def _refresh_smart_playlists(pks):
+    """Re-evaluate the smart playlists on rating of the songs `pks`.
+
+    Runs once the ratings are committed, which stay recorded whatever
+    happens here.
+    """
+    try:
+        with write_transaction():
+            smart_playlists.refresh_songs(pks, fields={'rating'})
+    except Exception:
+        logger.exception('Refreshing the smart playlists of songs %r failed',
+                         pks)
+
+
+def _ratings_changed(model, pks):
+    """Bring everything derived from the ratings of `pks` up to date.
+
+    Called inside the transaction of the rating updates, which only gains
+    the ratings version bump and, for songs, one UPDATE of the rating
+    columns of their cards. Smart playlists follow after the commit.
+    """
+    bump_ratings_version()
+
+    if model is Song:
+        # Queryset updates send no signal.
+        cards.refresh_ratings(pks)
+        transaction.on_commit(lambda: _refresh_smart_playlists(pks))
+
+
+def record_ratings(model, totals):
+    """Add rating totals, `{pk: (sum, count)}`, to rows of `model`.
+
+    Concurrent raters can never overwrite each other, as every row is
+    updated from its stored sum and count. The displayed `rating` is the
+    rounded mean of the exact running sum, it is never fed back into the
+    next average. The same transaction bumps the ratings version and, for
+    songs, copies the new ratings onto their cards; smart playlist
+    memberships are refreshed once it committed. Returns the number of rows
+    updated.
+    """
+    with transaction.atomic():
+        updated = [pk for pk, (total, count) in totals.items()
+                   if _add_rating(model, pk, total, count)]
+
+        if updated:
+            _ratings_changed(model, updated)
+
+    return len(updated)
+
+
+class RatingBuffer:
+    """Write-behind buffer for rating events.
+
+    Ratings are summed in memory per object and written by `flush()`, one
+    transaction for everything received since the previous flush. A daemon
+    thread flushes every `interval` seconds once the first rating arrives,
+    and is started again by the next rating if it ever died.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def add(self, model, pk, value):
+        with self._lock:
+            total, count = self._totals.get((model, pk), (0, 0))
+            self._totals[(model, pk)] = (total + value, count + 1)
+
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(
+                    target=self._run, name='rating-flusher', daemon=True)
+                self._flusher.start()
+
+    def flush(self):
+        """Write every buffered rating, returns the number of rows updated.
+
+        A row failing with anything but a database error is logged and
+        dropped, the others are still written. On a database error the
+        ratings go back into the buffer for the next flush.
+        """
+        with self._lock:
+            pending, self._totals = self._totals, {}
+
+        updated = {}
+
+        try:
+            with transaction.atomic():
+                for (model, pk), (total, count) in pending.items():
+                    try:
+                        if _add_rating(model, pk, total, count):
+                            updated.setdefault(model, []).append(pk)
+                    except DatabaseError:
+                        raise
+                    except Exception:
+                        logger.exception(
+                            'Dropped the ratings of %s %r',
+                            model.__name__, pk)
+
+                for model, pks in updated.items():
+                    _ratings_changed(model, pks)
+        except DatabaseError:
+            with self._lock:
+                for key, (total, count) in pending.items():
+                    buffered = self._totals.get(key, (0, 0))
+                    self._totals[key] = (
+                        buffered[0] + total, buffered[1] + count)
+            raise
+
+        return sum(len(pks) for pks in updated.values())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+
+            try:
+                self.flush()
+            except DatabaseError:
+                # Kept in the buffer, retried on the next interval.
+                pass
+            except Exception:
+                # Never let the thread die with ratings still to come.
+                logger.exception('Flushing buffered ratings failed')
+
+
+if settings.RATINGS_WRITE_BEHIND_INTERVAL:
+    buffer = RatingBuffer(settings.RATINGS_WRITE_BEHIND_INTERVAL)
+    atexit.register(buffer.flush)
+else:
+    buffer = None
+
+
+def rate(model, pk, value):
+    """Record one rating of the `model` row `pk`.
+
+    Written through right away, or handed to the write-behind buffer when
+    `RATINGS_WRITE_BEHIND_INTERVAL` is set.
+    """
+    if buffer is not None:
+        buffer.add(model, pk, value)
+    else:
+        record_ratings(model, {pk: (value, 1)})
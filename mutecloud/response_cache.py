@@ -0,0 +1,74 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from mutecloud.models import Playlist
+
+
+KEY_PREFIX = 'mutecloud:response'
+
+
+def response_cache():
+    """The Django cache backend holding rendered response data."""
+    return caches[settings.RESPONSE_CACHE]
+
+
+def cache_key(*parts):
+    """A backend safe key, any URL in `parts` hashed to a fixed length."""
+    digest = hashlib.sha1(
+        '\n'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    return '%s:%s' % (KEY_PREFIX, digest)
+
+
+def _generation_key(user_id):
+    return '%s:user:%s' % (KEY_PREFIX, user_id)
+
+
+def _new_generation(cache, user_id):
+    # Starts from the clock, so a generation evicted from the cache never
+    # comes back with a value that older entries were stored under.
+    cache.add(_generation_key(user_id), time.time_ns(), timeout=None)
+
+    return cache.get(_generation_key(user_id))
+
+
+def user_generation(user_id):
+    """Version of the cached responses of a user, part of their keys."""
+    cache = response_cache()
+    generation = cache.get(_generation_key(user_id))
+
+    if generation is None:
+        generation = _new_generation(cache, user_id)
+
+    return generation
+
+
+def _bump_generations(user_ids):
+    cache = response_cache()
+
+    for user_id in user_ids:
+        try:
+            cache.incr(_generation_key(user_id))
+        except ValueError:
+            _new_generation(cache, user_id)
+
+
+def invalidate_users(user_ids):
+    """Orphan every cached response of the given users.
+
+    Done right away and once more on commit, so a response cached from a
+    read racing the transaction does not outlive it.
+    """
+    user_ids = set(user_ids)
+    _bump_generations(user_ids)
+    transaction.on_commit(lambda: _bump_generations(user_ids))
+
+
+def invalidate_playlists(playlist_ids):
+    """Orphan the cached responses of the owners of the given playlists."""
+    invalidate_users(Playlist.objects.filter(
+        id__in=list(playlist_ids)).values_list('user_id', flat=True))
@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+CATALOG_DB_ALIAS = 'catalog'
+
+_catalog_reads = ContextVar('catalog_reads', default=False)
+
+
+@contextmanager
+def catalog_reads():
+    """Route the reads made in this block to the catalog connection."""
+    token = _catalog_reads.set(True)
+
+    try:
+        yield
+    finally:
+        _catalog_reads.reset(token)
+
+
+class CatalogRouter:
+    """Sends the reads of catalog requests to `CATALOG_DB_ALIAS`.
+
+    That alias is a second, read-only (`mode=ro`) connection to the same
+    SQLite file. Browsing never queues on the connection of a thread busy
+    writing, and can never write by mistake. Every write, and any read
+    outside of `catalog_reads()` or inside a transaction of the default
+    connection, stays on the default connection, so writes always read
+    their own changes. Without a `catalog` database everything stays on
+    the default one.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _catalog_reads.get() or (
+                CATALOG_DB_ALIAS not in connections.databases):
+            return None
+
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Inside a transaction, reads must see its uncommitted writes.
+            return None
+
+        return CATALOG_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Tables are only ever created through the writable connection.
+        return False if db == CATALOG_DB_ALIAS else None
@@ -0,0 +1,288 @@
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from django.db import transaction
+
+from mutecloud.cache import LRUCache
+from mutecloud.database import chunks
+from mutecloud.models import Song, Artist
+
+
+SEARCH_TABLE = 'search_song'
+SEARCH_COLUMNS = ('id', 'name', 'album_name', 'album_id', 'genre_name',
+                  'genre_id', 'artist_name', 'artist_id')
+
+# Upper bound on the ids packed into a single FTS column filter, so a
+# large reindex never builds one giant MATCH expression.
+ID_CHUNK_SIZE = 500
+
+# (response key, id column, name column) of every kind of completion.
+COMPLETION_KINDS = (
+    ('songs', 'id', 'name'),
+    ('albums', 'album_id', 'album_name'),
+    ('artists', 'artist_id', 'artist_name'),
+)
+COMPLETION_LIMIT = 5
+COMPLETION_MAX_LIMIT = 20
+COMPLETION_CACHE_SIZE = 2048
+COMPLETION_CACHE_TTL = 60
+
+RESULT_CACHE_SIZE = 1024
+
+HIGHLIGHT_COLUMNS = ('name', 'album_name', 'genre_name', 'artist_name')
+HIGHLIGHT_OPEN = '<b>'
+HIGHLIGHT_CLOSE = '</b>'
+
+INSERT_STATEMENT = 'INSERT INTO %s (%s) VALUES (%s)' % (
+    SEARCH_TABLE, ', '.join(SEARCH_COLUMNS),
+    ', '.join(['%s'] * len(SEARCH_COLUMNS)))
+
+# Deleting on a plain FTS column is a full scan of the virtual table, a
+# column filtered MATCH on `id` goes through the full-text index instead.
+DELETE_STATEMENT = (
+    'DELETE FROM %s WHERE rowid IN '
+    '(SELECT rowid FROM %s WHERE %s MATCH %%s)' % (
+        SEARCH_TABLE, SEARCH_TABLE, SEARCH_TABLE))
+
+
+def _id_filter(song_ids):
+    return 'id : (%s)' % ' OR '.join(str(int(pk)) for pk in song_ids)
+
+
+def song_rows(song_ids):
+    """Build the search rows of the given songs.
+
+    Every song gets one row per (genre, artist) pair, mirroring the layout
+    the `search_song` table always had. Songs missing genres or artists are
+    still indexed by name and album. Uses three queries per call, whatever
+    the number of songs.
+    """
+    songs = Song.objects.filter(id__in=song_ids).values_list(
+        'id', 'name', 'album__name', 'album_id')
+    genres = {}
+    artists = {}
+
+    for song_id, genre_id, genre_name in Song.genres.through.objects.filter(
+            song_id__in=song_ids).values_list(
+                'song_id', 'genre_id', 'genre__name'):
+        genres.setdefault(song_id, []).append((genre_name, genre_id))
+
+    for song_id, artist_id, artist_name in Artist.songs.through.objects.filter(
+            song_id__in=song_ids).values_list(
+                'song_id', 'artist_id', 'artist__name'):
+        artists.setdefault(song_id, []).append((artist_name, artist_id))
+
+    for song_id, name, album_name, album_id in songs:
+        for genre_name, genre_id in genres.get(song_id) or [('', '')]:
+            for artist_name, artist_id in artists.get(song_id) or [('', '')]:
+                yield (song_id, name, album_name, album_id, genre_name,
+                       genre_id, artist_name, artist_id)
+
+
+def unindex_songs(song_ids):
+    """Drop every search row of the given songs."""
+    completion_cache.clear()
+
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            DELETE_STATEMENT,
+            [(_id_filter(chunk),)
+             for chunk in chunks(song_ids, ID_CHUNK_SIZE)])
+
+
+def index_songs(song_ids):
+    """(Re)index the given songs, replacing any rows they already have."""
+    song_ids = list(set(song_ids))
+
+    if not song_ids:
+        return
+
+    for chunk in chunks(song_ids, ID_CHUNK_SIZE):
+        unindex_songs(chunk)
+
+        with connection.cursor() as cursor:
+            cursor.executemany(INSERT_STATEMENT, list(song_rows(chunk)))
+
+
+def rebuild_index(batch_size=ID_CHUNK_SIZE):
+    """Repopulate the whole search table from the catalog.
+
+    Songs are streamed in primary key order, `batch_size` at a time, and
+    each batch is written with a single parameterized bulk insert. Returns
+    the number of songs indexed.
+    """
+    indexed = 0
+    last_id = 0
+    completion_cache.clear()
+
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % SEARCH_TABLE)
+
+        while True:
+            song_ids = list(Song.objects.filter(id__gt=last_id).order_by(
+                'id').values_list('id', flat=True)[:batch_size])
+
+            if not song_ids:
+                break
+
+            cursor.executemany(INSERT_STATEMENT, list(song_rows(song_ids)))
+            indexed += len(song_ids)
+            last_id = song_ids[-1]
+
+        cursor.execute(
+            "INSERT INTO %s (%s) VALUES ('optimize')" % (
+                SEARCH_TABLE, SEARCH_TABLE))
+
+    return indexed
+
+
+# A song has one row per (genre, artist) pair, only its best ranked row is
+# kept, and LIMIT/OFFSET are applied before anything leaves SQLite.
+RANKED_PAGE_STATEMENT = (
+    'SELECT id, score, row FROM ('
+    'SELECT id, rank AS score, rowid AS row, ROW_NUMBER() OVER '
+    '(PARTITION BY id ORDER BY rank) AS position '
+    'FROM %s WHERE %s MATCH %%s'
+    ') WHERE position = 1 ORDER BY score, id LIMIT %%s OFFSET %%s' % (
+        SEARCH_TABLE, SEARCH_TABLE))
+
+HIGHLIGHT_STATEMENT = (
+    'SELECT rowid, %s FROM %s WHERE %s MATCH %%s AND rowid IN (%%s)' % (
+        ', '.join(
+            "highlight(%s, %d, '%s', '%s')" % (
+                SEARCH_TABLE, SEARCH_COLUMNS.index(column),
+                HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE)
+            for column in HIGHLIGHT_COLUMNS),
+        SEARCH_TABLE, SEARCH_TABLE))
+
+
+# Rendered result pages, keyed by catalog version, normalized query and
+# page, so an entry can never outlive the catalog it was built from.
+result_cache = LRUCache(RESULT_CACHE_SIZE)
+
+SearchHit = namedtuple('SearchHit', ['song_id', 'score', 'highlights'])
+SearchPage = namedtuple('SearchPage', ['number', 'hits', 'has_next'])
+
+
+class SearchQueryError(ValueError):
+    """The search query is not a valid FTS5 expression."""
+
+
+def normalize_query(query):
+    """Collapse the whitespace of a search query, which FTS5 ignores.
+
+    Case is kept, FTS5 operators such as `OR` and `NOT` are case sensitive.
+    """
+    return ' '.join(query.split())
+
+
+class SearchEngine:
+    """Ranked full-text search over the `search_song` table.
+
+    Runs on Django's managed connection for `using`, so it shares the
+    connection (and its lifetime) with the rest of the request instead of
+    opening a new one per search.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, page_size=None):
+        self.using = using
+        self.page_size = page_size or settings.REST_FRAMEWORK['PAGE_SIZE']
+
+    def search(self, query, page=1):
+        """Return one page of songs matching `query`, best BM25 rank first.
+
+        Only `page_size + 1` deduplicated rows are read back, the extra one
+        telling whether a next page exists.
+        """
+        offset = (page - 1) * self.page_size
+
+        try:
+            with transaction.atomic(using=self.using):
+                with connections[self.using].cursor() as cursor:
+                    cursor.execute(
+                        RANKED_PAGE_STATEMENT,
+                        [query, self.page_size + 1, offset])
+                    rows = cursor.fetchall()
+                    highlights = self._highlights(
+                        cursor, query,
+                        [row[2] for row in rows[:self.page_size]])
+        except DatabaseError as error:
+            raise SearchQueryError(str(error))
+
+        hits = [
+            SearchHit(int(song_id), score, highlights.get(row))
+            for song_id, score, row in rows[:self.page_size]]
+
+        return SearchPage(page, hits, len(rows) > self.page_size)
+
+    def _highlights(self, cursor, query, rowids):
+        if not rowids:
+            return {}
+
+        cursor.execute(
+            HIGHLIGHT_STATEMENT % ('%s', ', '.join(['%s'] * len(rowids))),
+            [query] + rowids)
+
+        return {
+            row[0]: dict(zip(HIGHLIGHT_COLUMNS, row[1:]))
+            for row in cursor.fetchall()}
+
+
+COMPLETION_STATEMENT = (
+    'SELECT %%(id)s, %%(name)s FROM ('
+    'SELECT %%(id)s, %%(name)s, rank AS score, ROW_NUMBER() OVER '
+    '(PARTITION BY %%(id)s ORDER BY rank) AS position '
+    'FROM %s WHERE %s MATCH %%%%s'
+    ') WHERE position = 1 ORDER BY score, %%(id)s LIMIT %%%%s' % (
+        SEARCH_TABLE, SEARCH_TABLE))
+
+completion_cache = LRUCache(COMPLETION_CACHE_SIZE, ttl=COMPLETION_CACHE_TTL)
+
+
+def completion_terms(text):
+    """Turn what the user typed so far into an FTS5 prefix expression.
+
+    Every word is quoted, so the input can never be an FTS syntax error,
+    and the last one is matched as a prefix. Returns None when nothing is
+    left to complete.
+    """
+    words = re.findall(r'\w+', text.lower())
+
+    if not words:
+        return None
+
+    return ' '.join('"%s"' % word for word in words) + '*'
+
+
+def complete(text, limit=COMPLETION_LIMIT, using=DEFAULT_DB_ALIAS):
+    """Top `limit` song, album and artist names starting with `text`.
+
+    Prefix lookups are served by the FTS5 prefix indexes of `search_song`,
+    and the results for hot prefixes are kept in `completion_cache`, which
+    is emptied whenever the index changes.
+    """
+    terms = completion_terms(text)
+
+    if terms is None:
+        return {kind: [] for kind, _, _ in COMPLETION_KINDS}
+
+    key = (terms, limit)
+    completions = completion_cache.get(key)
+
+    if completions is None:
+        completions = {}
+
+        with connections[using].cursor() as cursor:
+            for kind, id_column, name_column in COMPLETION_KINDS:
+                cursor.execute(
+                    COMPLETION_STATEMENT % {
+                        'id': id_column, 'name': name_column},
+                    ['%s : (%s)' % (name_column, terms), limit])
+                completions[kind] = [
+                    (int(pk), name) for pk, name in cursor.fetchall()]
+
+        completion_cache.set(key, completions)
+
+    return completions
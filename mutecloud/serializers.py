@@ -1,8 +1,89 @@
 from django.contrib.auth.models import User
+from django.db.models import CharField, Value
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 
+from mutecloud.database import chunks
 from mutecloud.models import (Song, Genre, Playlist, Album,
-                              Recommendation, Artist)
+                              Recommendation, Artist, PlaylistTrack, SongCard)
+
+
+RELATIONS_LINKS = 'links'
+RELATIONS_COUNT = 'count'
+
+
+def requested_fields(request):
+    """Field names asked for with `?fields=`, None when not restricted."""
+    if request is None or not request.query_params.get('fields'):
+        return None
+
+    return {name.strip()
+            for name in request.query_params['fields'].split(',')}
+
+
+def relations_mode(request):
+    """How to-many relations are rendered, `?relations=links|count`."""
+    if request is None:
+        return RELATIONS_LINKS
+
+    return request.query_params.get('relations', RELATIONS_LINKS)
+
+
+class RelationCountField(serializers.Field):
+    """Size of a to-many relation and the link paging through it.
+
+    Reads the `<relation>_count` annotation set up by the viewset instead
+    of loading the related objects.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return {
+            'count': getattr(instance, '%s_count' % self.field_name),
+            'url': reverse(
+                '%s-%s' % (instance._meta.model_name, self.field_name),
+                args=[instance.pk],
+                request=self.context.get('request')),
+        }
+
+
+class SparseFieldsMixin:
+    """Honours `?fields=` and `?relations=count` of the current request.
+
+    Fields outside `?fields=` are dropped, and with `?relations=count`
+    the relations listed in `Meta.counted_relations` are rendered as a
+    count and a paginated link instead of every related hyperlink.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = requested_fields(request)
+
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+        if relations_mode(request) == RELATIONS_COUNT:
+            for name in self.Meta.counted_relations:
+                if name in self.fields:
+                    self.fields[name] = RelationCountField()
+
+
+class LinkSerializer(serializers.Serializer):
+    """Url and name of a related object, for capped relation listings."""
+    url = serializers.SerializerMethodField()
+    name = serializers.CharField(read_only=True)
+
+    def get_url(self, instance):
+        return reverse(
+            '%s-detail' % instance._meta.model_name,
+            args=[instance.pk],
+            request=self.context.get('request'))
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -12,26 +93,32 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['url', 'username', 'email', 'groups', 'is_staff']
 
 
-class ArtistSerializer(serializers.HyperlinkedModelSerializer):
+class ArtistSerializer(SparseFieldsMixin,
+                       serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = Artist
         fields = ['url', 'albums', 'songs', 'genres', 'name']
+        counted_relations = ['albums', 'songs', 'genres']
 
 
-class GenreSerializer(serializers.HyperlinkedModelSerializer):
+class GenreSerializer(SparseFieldsMixin,
+                      serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = Genre
         fields = ['url', 'name', 'songs', 'albums', 'artists']
+        counted_relations = ['songs', 'albums', 'artists']
 
 
 class AlbumSerializer(serializers.HyperlinkedModelSerializer):
+    # Seconds, summed over the songs by the query.
+    total_length = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Album
         fields = ['url', 'name', 'genres', 'rating', 'reviewers',
-                  'released_on', 'album_length']
+                  'released_on', 'album_length', 'total_length']
 
 
 class SongSerializer(serializers.HyperlinkedModelSerializer):
@@ -42,11 +129,99 @@ class SongSerializer(serializers.HyperlinkedModelSerializer):
                   'song_length', 'rating', 'reviewers']
 
 
+class SongCardSerializer(serializers.ModelSerializer):
+    """A song as listed, rendered from its card alone.
+
+    Same fields as `SongSerializer`, plus the names of the album, genres
+    and artists. Links are built from the stored ids.
+    """
+    url = serializers.SerializerMethodField()
+    album = serializers.SerializerMethodField()
+    genres = serializers.SerializerMethodField()
+    genre_names = serializers.SerializerMethodField()
+    artists = serializers.SerializerMethodField()
+    artist_names = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SongCard
+        fields = ['url', 'name', 'album', 'album_name', 'genres',
+                  'genre_names', 'artists', 'artist_names', 'released_on',
+                  'song_length', 'rating', 'reviewers']
+
+    def link(self, view_name, pk):
+        return reverse(view_name, args=[pk],
+                       request=self.context.get('request'))
+
+    def get_url(self, card):
+        return self.link('song-detail', card.song_id)
+
+    def get_album(self, card):
+        return self.link('album-detail', card.album_id)
+
+    def get_genres(self, card):
+        return [self.link('genre-detail', pk) for pk, _ in card.genres]
+
+    def get_genre_names(self, card):
+        return [name for _, name in card.genres]
+
+    def get_artists(self, card):
+        return [self.link('artist-detail', pk) for pk, _ in card.artists]
+
+    def get_artist_names(self, card):
+        return [name for _, name in card.artists]
+
+
 class PlaylistSerializer(serializers.HyperlinkedModelSerializer):
+    tracks = serializers.HyperlinkedIdentityField(view_name='playlist-tracks')
+    # Seconds, summed over the tracks by the query.
+    total_length = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Playlist
-        fields = ['url', 'user', 'songs', 'name', 'created_on']
+        fields = ['url', 'user', 'songs', 'tracks', 'name', 'created_on',
+                  'rules', 'total_length']
+
+
+class PlaylistListSerializer(PlaylistSerializer):
+    """A playlist in a list, with the number of its tracks and the link
+    paging through them in place of every song.
+    """
+    tracks = RelationCountField()
+
+    class Meta(PlaylistSerializer.Meta):
+        fields = ['url', 'user', 'tracks', 'name', 'created_on', 'rules',
+                  'total_length']
+
+
+class PlaylistEditSerializer(serializers.Serializer):
+    """Song ids to add to and remove from a playlist."""
+    add = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list)
+    remove = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list)
+
+    def validate_add(self, song_ids):
+        found = set()
+
+        for chunk in chunks(set(song_ids)):
+            found.update(Song.objects.filter(id__in=chunk).values_list(
+                'id', flat=True))
+
+        unknown = sorted(set(song_ids) - found)
+
+        if unknown:
+            raise serializers.ValidationError(
+                'Unknown song ids: %s.' % ', '.join(map(str, unknown)))
+
+        return song_ids
+
+
+class PlaylistTrackSerializer(serializers.HyperlinkedModelSerializer):
+    name = serializers.CharField(source='song.name', read_only=True)
+
+    class Meta:
+        model = PlaylistTrack
+        fields = ['song', 'name', 'position']
 
 
 class RecommendationSerializer(serializers.HyperlinkedModelSerializer):
@@ -55,3 +230,74 @@ class RecommendationSerializer(serializers.HyperlinkedModelSerializer):
         model = Recommendation
         fields = ['url', 'from_user', 'song', 'recommended_on', 'album',
                   'genre', 'artist']
+
+
+RECOMMENDATION_TARGETS = {
+    'song': Song,
+    'album': Album,
+    'genre': Genre,
+    'artist': Artist,
+}
+
+
+class RecommendationItemSerializer(serializers.Serializer):
+    """One (item, user) pair of a bulk recommendation."""
+    user = serializers.IntegerField()
+    song = serializers.IntegerField(required=False)
+    album = serializers.IntegerField(required=False)
+    genre = serializers.IntegerField(required=False)
+    artist = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        targets = [name for name in RECOMMENDATION_TARGETS if name in attrs]
+
+        if len(targets) != 1:
+            raise serializers.ValidationError(
+                'Exactly one of %s is required.' % ', '.join(
+                    RECOMMENDATION_TARGETS))
+
+        return attrs
+
+
+class BulkRecommendationSerializer(serializers.Serializer):
+    max_recommendations = 1000
+    recommendations = RecommendationItemSerializer(
+        many=True, allow_empty=False)
+
+    def validate_recommendations(self, items):
+        """Check that every referenced user and item exists.
+
+        All the ids are looked up at once, in a single UNION query over
+        the user and catalog tables.
+        """
+        if len(items) > self.max_recommendations:
+            raise serializers.ValidationError(
+                'At most %d recommendations per request.' % (
+                    self.max_recommendations))
+
+        wanted = {'user': {item['user'] for item in items}}
+
+        for item in items:
+            for name in RECOMMENDATION_TARGETS:
+                if name in item:
+                    wanted.setdefault(name, set()).add(item[name])
+
+        models = dict(RECOMMENDATION_TARGETS, user=User)
+        lookups = [
+            models[name].objects.filter(id__in=ids).annotate(
+                kind=Value(name, output_field=CharField())
+            ).values_list('kind', 'id')
+            for name, ids in wanted.items()]
+        found = set(lookups[0].union(*lookups[1:], all=True))
+        missing = {
+            name: sorted(ids - {pk for kind, pk in found if kind == name})
+            for name, ids in wanted.items()}
+        missing = {name: ids for name, ids in missing.items() if ids}
+
+        if missing:
+            raise serializers.ValidationError(
+                ['Unknown %s ids: %s.' % (
+                    name, ', '.join(str(pk) for pk in ids))
+                 for name, ids in missing.items()])
+
+        return items
@@ -0,0 +1,167 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from mutecloud import cards, response_cache, search, smart_playlists
+from mutecloud.catalog import bump_catalog_version
+from mutecloud.models import (Song, Album, Genre, Artist, Playlist,
+                              Recommendation)
+
+CATALOG_MODELS = (Song, Album, Genre, Artist)
+CATALOG_THROUGH_MODELS = (Song.genres.through, Album.genres.through,
+                          Artist.songs.through, Artist.albums.through,
+                          Artist.genres.through)
+
+
+def _related_song_ids(instance, model, pk_set, reverse_lookup):
+    """Song ids touched by an m2m change, from whichever side it came."""
+    if isinstance(instance, Song):
+        return [instance.pk]
+
+    if pk_set is not None and model is Song:
+        return list(pk_set)
+
+    return list(Song.objects.filter(
+        **{reverse_lookup: instance}).values_list('id', flat=True))
+
+
+def reindex_songs(song_ids):
+    """Rebuild the search rows and the cards of songs."""
+    song_ids = list(song_ids)
+    search.index_songs(song_ids)
+    cards.refresh_cards(song_ids)
+
+
+def songs_changed(song_ids, fields=None):
+    """Reindex songs whose attributes changed and refresh the smart
+    playlists referring to the changed rule `fields`, all if None.
+    """
+    song_ids = list(song_ids)
+    reindex_songs(song_ids)
+    smart_playlists.refresh_songs(song_ids, fields)
+
+
+@receiver(post_save, sender=Song, dispatch_uid='search_song_saved')
+def reindex_saved_song(sender, instance, raw=False, update_fields=None,
+                       **kwargs):
+    if not raw:
+        songs_changed([instance.pk],
+                      smart_playlists.saved_rule_fields(update_fields))
+
+
+@receiver(post_delete, sender=Song, dispatch_uid='search_song_deleted')
+def unindex_deleted_song(sender, instance, **kwargs):
+    search.unindex_songs([instance.pk])
+
+
+@receiver(post_save, sender=Album, dispatch_uid='search_album_saved')
+def reindex_album_songs(sender, instance, created, raw=False, **kwargs):
+    if not (created or raw):
+        reindex_songs(instance.songs.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Genre, dispatch_uid='search_genre_saved')
+def reindex_genre_songs(sender, instance, created, raw=False, **kwargs):
+    if not (created or raw):
+        reindex_songs(instance.songs.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Artist, dispatch_uid='search_artist_saved')
+def reindex_artist_songs(sender, instance, created, raw=False, **kwargs):
+    if not (created or raw):
+        reindex_songs(instance.songs.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Genre, dispatch_uid='search_genre_deleting')
+@receiver(pre_delete, sender=Artist, dispatch_uid='search_artist_deleting')
+def remember_deleted_songs(sender, instance, **kwargs):
+    # Cascading deletes of through rows fire no m2m signal, so keep the
+    # affected songs around until the row is actually gone.
+    instance._search_song_ids = list(
+        instance.songs.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Genre, dispatch_uid='search_genre_deleted')
+@receiver(post_delete, sender=Artist, dispatch_uid='search_artist_deleted')
+def reindex_deleted_songs(sender, instance, **kwargs):
+    songs_changed(getattr(instance, '_search_song_ids', []),
+                  {'genre' if sender is Genre else 'artist'})
+
+
+@receiver(m2m_changed, sender=Song.genres.through,
+          dispatch_uid='search_song_genres_changed')
+def reindex_song_genres(sender, instance, action, model, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        songs_changed(
+            _related_song_ids(instance, model, pk_set, 'genres'), {'genre'})
+    elif action == 'pre_clear' and not isinstance(instance, Song):
+        # The songs losing the genre are gone by `post_clear`.
+        instance._search_song_ids = _related_song_ids(
+            instance, model, pk_set, 'genres')
+    elif action == 'post_clear':
+        songs_changed(getattr(
+            instance, '_search_song_ids', [instance.pk]), {'genre'})
+
+
+@receiver(m2m_changed, sender=Artist.songs.through,
+          dispatch_uid='search_artist_songs_changed')
+def reindex_artist_songs_changed(sender, instance, action, model, pk_set,
+                                 **kwargs):
+    if action in ('post_add', 'post_remove'):
+        songs_changed(
+            _related_song_ids(instance, model, pk_set, 'artists'), {'artist'})
+    elif action == 'pre_clear' and not isinstance(instance, Song):
+        instance._search_song_ids = _related_song_ids(
+            instance, model, pk_set, 'artists')
+    elif action == 'post_clear':
+        songs_changed(getattr(
+            instance, '_search_song_ids', [instance.pk]), {'artist'})
+
+
+def bump_catalog(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_catalog_version()
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(bump_catalog, sender=model,
+                      dispatch_uid='catalog_saved_%s' % model.__name__)
+    post_delete.connect(bump_catalog, sender=model,
+                        dispatch_uid='catalog_deleted_%s' % model.__name__)
+
+for through in CATALOG_THROUGH_MODELS:
+    m2m_changed.connect(bump_catalog, sender=through,
+                        dispatch_uid='catalog_changed_%s' % through.__name__)
+
+
+@receiver(post_save, sender=Playlist, dispatch_uid='cache_playlist_saved')
+@receiver(post_delete, sender=Playlist, dispatch_uid='cache_playlist_deleted')
+def invalidate_playlist_owner(sender, instance, **kwargs):
+    response_cache.invalidate_users([instance.user_id])
+
+
+@receiver(m2m_changed, sender=Playlist.songs.through,
+          dispatch_uid='cache_playlist_songs_changed')
+def invalidate_playlist_songs_owner(sender, instance, action, pk_set,
+                                    **kwargs):
+    # Track edits of `mutecloud.playlists` invalidate by themselves, this
+    # covers the plain many to many manager, from either side.
+    if isinstance(instance, Playlist):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            response_cache.invalidate_users([instance.user_id])
+    elif action in ('post_add', 'post_remove'):
+        response_cache.invalidate_playlists(pk_set)
+    elif action == 'pre_clear':
+        instance._cache_playlist_ids = list(
+            instance.playlists.values_list('id', flat=True))
+    elif action == 'post_clear':
+        response_cache.invalidate_playlists(
+            getattr(instance, '_cache_playlist_ids', []))
+
+
+@receiver(post_save, sender=Recommendation,
+          dispatch_uid='cache_recommendation_saved')
+@receiver(post_delete, sender=Recommendation,
+          dispatch_uid='cache_recommendation_deleted')
+def invalidate_recommended_user(sender, instance, **kwargs):
+    response_cache.invalidate_users([instance.for_user_id])
@@ -0,0 +1,69 @@
+"""Top-K song neighbours from a normalized feature matrix.
+
+Nothing here touches Django, so the process pool workers can import this
+module whatever the multiprocessing start method.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+NEIGHBOURS = 20
+# Each shard scores its rows against every song at once.
+SHARD_SIZE = 256
+
+_shared = {}
+
+
+def _init_worker(matrix, song_ids, k):
+    # Sent once per worker, not once per shard.
+    _shared.update(
+        matrix=matrix, transposed=matrix.T.tocsr(), song_ids=song_ids, k=k)
+
+
+def shard_neighbours(start, stop):
+    """(song id, neighbour id, rank, score) of the rows `start:stop`."""
+    matrix, song_ids, k = _shared['matrix'], _shared['song_ids'], _shared['k']
+    scores = (matrix[start:stop] @ _shared['transposed']).tocsr()
+    rows = []
+
+    for offset in range(stop - start):
+        row = start + offset
+        begin, end = scores.indptr[offset], scores.indptr[offset + 1]
+        columns = scores.indices[begin:end]
+        values = scores.data[begin:end]
+        keep = (columns != row) & (values > 0)
+        columns, values = columns[keep], values[keep]
+
+        if columns.size > k:
+            best = np.argpartition(-values, k - 1)[:k]
+            columns, values = columns[best], values[best]
+
+        order = np.argsort(-values, kind='stable')
+
+        for rank, index in enumerate(order, 1):
+            rows.append((int(song_ids[row]), int(song_ids[columns[index]]),
+                         rank, float(values[index])))
+
+    return rows
+
+
+def top_neighbours(matrix, song_ids, k=NEIGHBOURS, workers=None,
+                   shard_size=SHARD_SIZE):
+    """Yield the neighbour rows of every song, one shard at a time.
+
+    `matrix` has one L2 normalized row per id of `song_ids`. Shards of
+    `shard_size` rows are scored against the whole matrix by a pool of
+    `workers` processes, with a single sparse product each.
+    """
+    starts = range(0, len(song_ids), shard_size)
+    stops = [min(start + shard_size, len(song_ids)) for start in starts]
+
+    if not stops:
+        return
+
+    with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(matrix, song_ids, k)) as pool:
+        for rows in pool.map(shard_neighbours, starts, stops):
+            yield rows
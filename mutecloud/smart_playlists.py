@@ -0,0 +1,210 @@
+import datetime
+
+from django.db.models import BooleanField, ExpressionWrapper, Q
+
+from mutecloud import playlists
+from mutecloud.models import Song, Artist, Playlist, PlaylistTrack
+from mutecloud.response_cache import invalidate_playlists
+
+
+MATCH_ALL = 'all'
+MATCH_ANY = 'any'
+
+# Smart playlists evaluated per query when refreshing changed songs.
+REFRESH_CHUNK_SIZE = 100
+
+
+class RuleError(ValueError):
+    """A smart playlist rule set that cannot be compiled."""
+
+
+def _ids(value):
+    if not isinstance(value, list) or not value or not all(
+            isinstance(pk, int) and not isinstance(pk, bool)
+            for pk in value):
+        raise RuleError('Expected a non empty list of ids.')
+
+    return value
+
+
+def _number(value):
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise RuleError('Expected an integer.')
+
+    return value
+
+
+def _date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise RuleError('Expected a YYYY-MM-DD date.')
+
+
+def _related(through, column):
+    """Songs with a `through` row pointing at one of the given ids."""
+    def lookup(ids):
+        return Q(id__in=through.objects.filter(
+            **{'%s__in' % column: ids}).values('song_id'))
+
+    return lookup
+
+
+# field -> (parse value, supported operators, build the Q of `in`, or the
+# field compared by the other operators).
+RULE_FIELDS = {
+    'genre': (_ids, {'in'}, _related(Song.genres.through, 'genre_id')),
+    'artist': (_ids, {'in'}, _related(Artist.songs.through, 'artist_id')),
+    'album': (_ids, {'in'}, lambda ids: Q(album_id__in=ids)),
+    'rating': (_number, {'eq', 'lt', 'lte', 'gt', 'gte'}, 'rating'),
+    'released_on': (_date, {'eq', 'lt', 'lte', 'gt', 'gte'}, 'released_on'),
+    'length': (_number, {'eq', 'lt', 'lte', 'gt', 'gte'}, 'song_length'),
+}
+
+# Song column -> the rule field it backs. Saving any other column of a
+# song can change no smart playlist.
+SONG_RULE_FIELDS = {
+    'album': 'album',
+    'rating': 'rating',
+    'released_on': 'released_on',
+    'song_length': 'length',
+}
+
+
+def compile_rules(rules):
+    """Compile a rule set into a single `Q` over `Song`.
+
+    A rule set looks like::
+
+        {"match": "all",
+         "conditions": [{"field": "genre", "op": "in", "value": [1, 2]},
+                        {"field": "rating", "op": "gte", "value": 4}]}
+
+    `match` is `all` (AND, the default) or `any` (OR).
+    """
+    if not isinstance(rules, dict):
+        raise RuleError('Rules must be an object.')
+
+    match = rules.get('match', MATCH_ALL)
+    conditions = rules.get('conditions')
+
+    if match not in (MATCH_ALL, MATCH_ANY):
+        raise RuleError('match must be "all" or "any".')
+
+    if not isinstance(conditions, list) or not conditions:
+        raise RuleError('conditions must be a non empty list.')
+
+    compiled = Q()
+
+    for condition in conditions:
+        if not isinstance(condition, dict) or (
+                condition.get('field') not in RULE_FIELDS):
+            raise RuleError('field must be one of %s.' % ', '.join(
+                RULE_FIELDS))
+
+        parse, operators, target = RULE_FIELDS[condition['field']]
+
+        if condition.get('op') not in operators:
+            raise RuleError('op of %s must be one of %s.' % (
+                condition['field'], ', '.join(sorted(operators))))
+
+        value = parse(condition.get('value'))
+
+        if condition['op'] == 'in':
+            q = target(value)
+        elif condition['op'] == 'eq':
+            q = Q(**{target: value})
+        else:
+            q = Q(**{'%s__%s' % (target, condition['op']): value})
+
+        compiled = compiled & q if match == MATCH_ALL else compiled | q
+
+    return compiled
+
+
+def rule_fields(rules):
+    """The fields the conditions of a compiled rule set refer to."""
+    return {condition['field'] for condition in rules['conditions']}
+
+
+def saved_rule_fields(update_fields):
+    """The rule fields a save of `update_fields` of a song may change,
+    or None for a save of the whole row.
+    """
+    if update_fields is None:
+        return None
+
+    return {SONG_RULE_FIELDS[name] for name in update_fields
+            if name in SONG_RULE_FIELDS}
+
+
+def songs_matching(rules):
+    """The songs matching a rule set, as one query."""
+    return Song.objects.filter(compile_rules(rules))
+
+
+def materialize(playlist):
+    """Bring the songs of a smart playlist in line with its rules.
+
+    Returns the song ids added and removed.
+    """
+    matching = set(songs_matching(playlist.rules).values_list(
+        'id', flat=True))
+    present = set(PlaylistTrack.objects.filter(
+        playlist=playlist).values_list('song_id', flat=True))
+
+    return playlists.edit_tracks(
+        playlist,
+        add=sorted(matching - present),
+        remove=sorted(present - matching))
+
+
+def refresh_songs(song_ids, fields=None):
+    """Re-evaluate changed songs against the smart playlists whose rules
+    refer to one of the changed rule `fields`, or to any of them if None.
+
+    Each chunk of smart playlists costs one query, which tests all of the
+    songs against all of their rules at once, plus the membership diff. No
+    smart playlist is recomputed from scratch.
+    """
+    song_ids = list(set(song_ids))
+
+    if not song_ids or fields is not None and not fields:
+        return
+
+    smart = list(Playlist.objects.filter(is_smart=True).values_list(
+        'id', 'rules'))
+
+    if fields is not None:
+        smart = [(playlist_id, rules) for playlist_id, rules in smart
+                 if rule_fields(rules) & set(fields)]
+
+    for start in range(0, len(smart), REFRESH_CHUNK_SIZE):
+        chunk = smart[start:start + REFRESH_CHUNK_SIZE]
+        flags = {
+            'smart_%d' % playlist_id: ExpressionWrapper(
+                compile_rules(rules), output_field=BooleanField())
+            for playlist_id, rules in chunk}
+        matches = Song.objects.filter(id__in=song_ids).annotate(
+            **flags).values_list('id', *flags)
+        present = set(PlaylistTrack.objects.filter(
+            playlist_id__in=[playlist_id for playlist_id, _ in chunk],
+            song_id__in=song_ids).values_list('playlist_id', 'song_id'))
+        additions = {}
+        removals = Q()
+        shrunk = set()
+
+        for song_id, *matched in matches:
+            for (playlist_id, _), match in zip(chunk, matched):
+                if match and (playlist_id, song_id) not in present:
+                    additions.setdefault(playlist_id, []).append(song_id)
+                elif not match and (playlist_id, song_id) in present:
+                    removals |= Q(playlist_id=playlist_id, song_id=song_id)
+                    shrunk.add(playlist_id)
+
+        for playlist_id, added in additions.items():
+            playlists.append_tracks(Playlist(id=playlist_id), added)
+
+        if removals:
+            PlaylistTrack.objects.filter(removals).delete()
+            invalidate_playlists(shrunk)
@@ -0,0 +1,187 @@
+import logging
+import threading
+
+import numpy as np
+from django.db import connection
+from scipy import sparse
+
+from mutecloud.catalog import catalog_version
+from mutecloud.database import chunks
+from mutecloud.models import Song, Artist, PlaylistTrack
+
+
+logger = logging.getLogger(__name__)
+
+# How much sharing each kind of feature counts for, before the inverse
+# frequency weighting that keeps huge genres from drowning the rest.
+GENRE_WEIGHT = 1.0
+ALBUM_WEIGHT = 2.0
+ARTIST_WEIGHT = 3.0
+PLAYLIST_WEIGHT = 1.0
+
+SUGGESTION_LIMIT = 10
+SUGGESTION_MAX_LIMIT = 100
+
+
+class SongFeatures:
+    """Sparse song x feature matrix over genres, albums and artists.
+
+    With `playlists`, the playlists a song is in are features too, so songs
+    often listed together get closer. Rows are L2 normalized and features
+    weighted by their inverse song frequency, so the dot product of two rows
+    is a cosine similarity. Built from one query per kind of feature over
+    the whole catalog.
+    """
+
+    def __init__(self, playlists=False):
+        song_ids = []
+        rows = []
+        columns = []
+        weights = []
+        features = {}
+
+        def add(song_id, feature, weight):
+            rows.append(song_id)
+            columns.append(features.setdefault(feature, len(features)))
+            weights.append(weight)
+
+        for song_id, album_id in Song.objects.values_list('id', 'album_id'):
+            song_ids.append(song_id)
+            add(song_id, ('album', album_id), ALBUM_WEIGHT)
+
+        for song_id, genre_id in Song.genres.through.objects.values_list(
+                'song_id', 'genre_id'):
+            add(song_id, ('genre', genre_id), GENRE_WEIGHT)
+
+        for song_id, artist_id in Artist.songs.through.objects.values_list(
+                'song_id', 'artist_id'):
+            add(song_id, ('artist', artist_id), ARTIST_WEIGHT)
+
+        if playlists:
+            for song_id, playlist_id in PlaylistTrack.objects.values_list(
+                    'song_id', 'playlist_id'):
+                add(song_id, ('playlist', playlist_id), PLAYLIST_WEIGHT)
+
+        self.song_ids = np.array(song_ids, dtype=np.int64)
+        self.index = {song_id: row for row, song_id in enumerate(song_ids)}
+        matrix = sparse.csr_matrix(
+            (np.array(weights),
+             (np.array([self.index[pk] for pk in rows], dtype=np.int64),
+              np.array(columns, dtype=np.int64))),
+            shape=(len(song_ids), len(features)))
+
+        frequency = np.bincount(matrix.indices, minlength=len(features))
+        idf = np.log((1.0 + len(song_ids)) / (1.0 + frequency)) + 1.0
+        matrix = matrix @ sparse.diags(idf)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)))
+        norms[norms == 0] = 1.0
+        self.matrix = sparse.csr_matrix(matrix.multiply(1.0 / norms))
+
+    def suggest(self, song_ids, limit=SUGGESTION_LIMIT):
+        """Top `limit` (song id, score) pairs for a set of liked songs.
+
+        The profile is the sum of the liked rows, every song is scored
+        against it with a single sparse matrix-vector product, and the best
+        ones are picked with a partial sort. Liked songs are never
+        suggested.
+        """
+        rows = [self.index[pk] for pk in song_ids if pk in self.index]
+
+        if not rows:
+            return []
+
+        profile = np.asarray(self.matrix[rows].sum(axis=0)).ravel()
+        scores = self.matrix @ profile
+        scores[rows] = -np.inf
+        candidates = np.flatnonzero(scores > 0)
+
+        if candidates.size > limit:
+            candidates = candidates[
+                np.argpartition(-scores[candidates], limit - 1)[:limit]]
+
+        best = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        return [(int(self.song_ids[row]), float(scores[row])) for row in best]
+
+
+_features = {'version': None, 'matrix': None, 'rebuilder': None}
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def rebuild_features():
+    """Build the feature matrix of the current catalog and swap it in,
+    unless it is up to date already. Returns the matrix.
+    """
+    with _build_lock:
+        version = catalog_version()
+
+        if _features['version'] != version or _features['matrix'] is None:
+            matrix = SongFeatures()
+
+            with _lock:
+                _features.update(version=version, matrix=matrix)
+
+        return _features['matrix']
+
+
+def _rebuild_in_background():
+    try:
+        rebuild_features()
+    except Exception:
+        logger.exception('Rebuilding the song features failed')
+    finally:
+        connection.close()
+
+        with _lock:
+            _features['rebuilder'] = None
+
+
+def song_features():
+    """The feature matrix of the catalog.
+
+    Only the first call of a process builds it. Once the catalog version
+    changes, a background thread builds the new one and swaps it in, and
+    the previous matrix keeps serving until then.
+    """
+    version = catalog_version()
+
+    with _lock:
+        matrix = _features['matrix']
+
+        if matrix is not None and _features['version'] != version and (
+                _features['rebuilder'] is None):
+            _features['rebuilder'] = threading.Thread(
+                target=_rebuild_in_background, name='song-features',
+                daemon=True)
+            _features['rebuilder'].start()
+
+    return matrix if matrix is not None else rebuild_features()
+
+
+def suggest_for_playlist(playlist, limit=SUGGESTION_LIMIT):
+    """Songs to suggest for `playlist`, best first, with their scores.
+
+    The matrix may predate the latest catalog changes, so suggestions are
+    checked against the songs that still exist, asking for more while
+    deleted ones leave the list short.
+    """
+    song_ids = list(PlaylistTrack.objects.filter(
+        playlist=playlist).values_list('song_id', flat=True))
+    features = song_features()
+    wanted = limit
+
+    while True:
+        scored = features.suggest(song_ids, limit=wanted)
+        live = set()
+
+        for chunk in chunks([pk for pk, _ in scored]):
+            live.update(Song.objects.filter(id__in=chunk).values_list(
+                'id', flat=True))
+
+        suggested = [(pk, score) for pk, score in scored if pk in live]
+
+        if len(suggested) >= limit or len(scored) < wanted:
+            return suggested[:limit]
+
+        wanted *= 2
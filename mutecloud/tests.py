@@ -1,3 +1,1238 @@
-from django.test import TestCase
+import base64
+import contextlib
+import datetime
+import io
+import json
+import os
+import re
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import (DEFAULT_DB_ALIAS, IntegrityError, OperationalError,
+                       connection, connections, transaction)
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from mutecloud import (export, playlists, ratings, similarity,
+                       smart_playlists, suggestions)
+from mutecloud.cards import rebuild_cards
+from mutecloud.catalog import catalog_version
+from mutecloud.database import ID_CHUNK_SIZE
+from mutecloud.ingest import CatalogIngest
+from mutecloud.models import (Song, Genre, Playlist, Album,
+                              Recommendation, Artist, PlaylistTrack,
+                              SimilarSong, SongCard)
+from mutecloud.ratings import RatingBuffer, record_ratings
+from mutecloud.search import SearchEngine, result_cache
+from mutecloud.response_cache import response_cache
+
+
+def create_catalog(size):
+    """Catalog of `size` albums, genres, artists and songs, all linked."""
+    genres = [Genre.objects.create(name='Genre %d' % i) for i in range(size)]
+    albums = []
+    artists = []
+    songs = []
+
+    for i in range(size):
+        album = Album.objects.create(name='Album %d' % i, album_length=2400)
+        album.genres.set(genres)
+        albums.append(album)
+
+    for i in range(size):
+        song = Song.objects.create(
+            name='Song %d' % i, album=albums[i], song_length=210)
+        song.genres.set(genres)
+        songs.append(song)
+
+    for i in range(size):
+        artist = Artist.objects.create(name='Artist %d' % i)
+        artist.albums.set(albums)
+        artist.songs.set(songs)
+        artist.genres.set(genres)
+        artists.append(artist)
+
+    return genres, albums, artists, songs
+
+
+@contextlib.contextmanager
+def run_on_commit():
+    """Run the `on_commit` callbacks registered inside the block, which the
+    never committed transaction of a test case would drop.
+    """
+    start = len(connection.run_on_commit)
+    yield
+
+    while len(connection.run_on_commit) > start:
+        _, callback = connection.run_on_commit.pop(start)
+        callback()
+
+
+class ClientTestCase(TestCase):
+    """Runs its requests as `cls.user`, set up by the subclass."""
+
+    def setUp(self):
+        # Versions restart with every test, so would cached responses.
+        response_cache().clear()
+        result_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class QueryCountTests(ClientTestCase):
+    """Every endpoint costs the same number of queries, whatever the size
+    of the page or of the relations it renders.
+    """
+    # Catalog sizes, which are also the number of relations of every row.
+    SIZES = (2, 12)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        cls.friend = User.objects.create_user('friend', password='secret')
+
+    def catalog(self, size):
+        """Catalog of `size`, with as many playlists and recommendations,
+        returns the ids of its first song, album, genre and artist and of
+        its last playlist.
+        """
+        genres, albums, artists, songs = create_catalog(size)
+
+        for i in range(size):
+            playlist = Playlist.objects.create(
+                name='Playlist %d' % i, user=self.user)
+            playlist.songs.set(songs)
+            Recommendation.objects.create(
+                from_user=self.friend, for_user=self.user, song=songs[i],
+                album=albums[i], genre=genres[i], artist=artists[i])
+
+        return {'song': songs[0].id, 'album': albums[0].id,
+                'genre': genres[0].id, 'artist': artists[0].id,
+                'playlist': playlist.id}
+
+    def assertQueries(self, *expected):
+        """Every `(url, queries)` pair costs exactly `queries` queries over
+        a catalog of each of `SIZES`, the url being formatted with the ids
+        of that catalog.
+        """
+        for size in self.SIZES:
+            with transaction.atomic():
+                ids = self.catalog(size)
+                response_cache().clear()
+                result_cache.clear()
+
+                for url, num in expected:
+                    with self.subTest(size=size, url=url):
+                        with self.assertNumQueries(num):
+                            response = self.client.get(url % ids)
+
+                        self.assertEqual(response.status_code, 200)
+
+                transaction.set_rollback(True)
+
+    def test_list_endpoints(self):
+        # Page (with a COUNT unless keyset paginated) and one query per
+        # rendered many to many relation, after the catalog version of the
+        # conditional GET on catalog endpoints, and the catalog version and
+        # owner of the per user cache keys.
+        self.assertQueries(
+            ('/songs/', 2),
+            ('/albums/', 3),
+            ('/genres/', 6),
+            ('/artists/', 5),
+            ('/users/', 3),
+            ('/playlists/', 3),
+            ('/recommendations/', 2))
+
+    def test_detail_endpoints(self):
+        self.assertQueries(
+            ('/songs/%(song)d/', 3),
+            ('/albums/%(album)d/', 3),
+            ('/genres/%(genre)d/', 5),
+            ('/artists/%(artist)d/', 5),
+            ('/playlists/%(playlist)d/', 4))
+
+    def test_sparse_relations(self):
+        # Counted or left out relations are never loaded.
+        self.assertQueries(
+            ('/genres/?relations=count', 3),
+            ('/artists/?relations=count', 2),
+            ('/genres/?fields=url,name', 3),
+            ('/artists/?fields=name,songs', 3),
+            ('/genres/%(genre)d/songs/', 4))
+
+
+class KeysetPaginationTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+
+        # Few distinct release dates, so most pages split a run of ties.
+        for i in range(35):
+            Album.objects.create(
+                name='Album %d' % i, album_length=2400,
+                released_on=datetime.date(2020, 1, 1 + i % 3))
+
+    def test_walks_every_album_once_in_order(self):
+        expected = [name for name, in Album.objects.order_by(
+            '-released_on', '-id').values_list('name')]
+        names = []
+        url = '/albums/'
+
+        while url:
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+
+            names.extend(album['name'] for album in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(names, expected)
+
+        # And back again from the last page.
+        previous = self.client.get(response.data['previous']).data
+        self.assertEqual(
+            [album['name'] for album in previous['results']],
+            expected[-15:-5])
+
+    def test_rejects_tampered_cursors(self):
+        def cursor(*position):
+            return base64.urlsafe_b64encode(
+                json.dumps({'p': position}).encode()).decode()
+
+        for url in (
+                '/albums/?cursor=' + cursor('soon', 1),
+                '/albums/?cursor=' + cursor('2020-13-01', 1),
+                '/albums/?cursor=' + cursor(None, 1),
+                '/albums/?cursor=' + cursor('2020-01-01', 'abc'),
+                '/albums/?cursor=' + cursor('2020-01-01', [1]),
+                '/albums/?cursor=' + cursor('2020-01-01'),
+                '/albums/?cursor=%%%',
+                '/songs/?ordering=rating&cursor=' + cursor(
+                    'x', '2020-01-01', 1),
+                '/songs/?ordering=length&cursor=' + cursor(180, None),
+                '/artists/?cursor=' + cursor('Numb', 'abc'),
+                '/recommendations/?cursor=' + cursor('yesterday', 1)):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class RatingTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        _, albums, _, songs = create_catalog(2)
+        cls.album, cls.song = albums[0], songs[0]
+
+    def rating(self, obj):
+        obj.refresh_from_db()
+
+        return obj.rating, obj.rating_sum, obj.reviewers
+
+    def test_rounded_mean_of_the_running_sum(self):
+        url = '/songs/%d/rate-song/' % self.song.id
+
+        for value in (5, 4, 4):
+            response = self.client.put(url, {'rating': value}, format='json')
+            self.assertEqual(response.status_code, 202)
+
+        self.assertEqual(self.rating(self.song), (4, 13, 3))
+        self.assertEqual(response.data['rating'], 4)
+
+        # 4.5 rounds up.
+        record_ratings(Album, {self.album.id: (9, 2)})
+        self.assertEqual(self.rating(self.album), (5, 9, 2))
+        self.assertEqual(SongCard.objects.get(song=self.song).rating, 4)
+
+    def test_rejects_unknown_objects_and_ratings(self):
+        for url, rating in (('/songs/abc/rate-song/', 4),
+                            ('/songs/0/rate-song/', 4),
+                            ('/albums/abc/rate-album/', 4)):
+            self.assertEqual(self.client.put(
+                url, {'rating': rating}, format='json').status_code, 404)
+
+        self.assertEqual(self.client.put(
+            '/songs/%d/rate-song/' % self.song.id, {'rating': 6},
+            format='json').status_code, 400)
+
+    def test_transaction_only_writes_the_ratings(self):
+        playlist = Playlist.objects.create(
+            name='Loved', user=self.user, is_smart=True, rules={
+                'conditions': [{'field': 'rating', 'op': 'gte', 'value': 4}]})
+
+        with CaptureQueriesContext(connection) as queries:
+            record_ratings(Song, {self.song.id: (4, 1)})
+
+        # Smart playlists wait for the commit.
+        self.assertEqual(
+            [query['sql'].split('"')[1] for query in queries.captured_queries
+             if query['sql'].startswith('UPDATE')],
+            ['mutecloud_song', 'mutecloud_catalogversion',
+             'mutecloud_songcard'])
+        self.assertEqual(SongCard.objects.get(song=self.song).rating, 4)
+        self.assertFalse(playlist.songs.exists())
+
+        with run_on_commit():
+            record_ratings(Song, {self.song.id: (4, 1)})
+
+        self.assertEqual(list(playlist.songs.all()), [self.song])
+
+
+@mock.patch.object(RatingBuffer, '_run', lambda buffer: None)
+class RatingBufferTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        _, albums, _, songs = create_catalog(2)
+        cls.album, cls.songs = albums[0], songs
+
+    def setUp(self):
+        super().setUp()
+        self.buffer = RatingBuffer(interval=60)
+
+    def test_flush_writes_the_sums_of_buffered_ratings(self):
+        for value in (5, 4, 2):
+            self.buffer.add(Song, self.songs[0].id, value)
+
+        self.buffer.add(Album, self.album.id, 3)
+        self.assertEqual(self.songs[0].reviewers, 0)
+        self.assertEqual(self.buffer.flush(), 2)
+
+        self.songs[0].refresh_from_db()
+        self.album.refresh_from_db()
+        self.assertEqual((self.songs[0].rating_sum, self.songs[0].reviewers),
+                         (11, 3))
+        self.assertEqual((self.album.rating_sum, self.album.reviewers), (3, 1))
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_a_bad_row_does_not_lose_the_others(self):
+        self.buffer.add(Song, 'abc', 4)
+        self.buffer.add(Song, self.songs[1].id, 4)
+
+        with self.assertLogs('mutecloud.ratings', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 1)
+
+        self.songs[1].refresh_from_db()
+        self.assertEqual(self.songs[1].reviewers, 1)
+
+    def test_restarts_a_dead_flusher(self):
+        self.buffer.add(Song, self.songs[0].id, 4)
+        flusher = self.buffer._flusher
+        flusher.join()
+
+        self.buffer.add(Song, self.songs[0].id, 4)
+        self.assertIsNot(self.buffer._flusher, flusher)
+
+    def test_unknown_objects_are_never_buffered(self):
+        with mock.patch.object(ratings, 'buffer', self.buffer):
+            response = self.client.put(
+                '/songs/abc/rate-song/', {'rating': 4}, format='json')
+            self.assertEqual(response.status_code, 404)
+            self.client.put('/songs/%d/rate-song/' % self.songs[0].id,
+                            {'rating': 4}, format='json')
+
+        self.assertEqual(list(self.buffer._totals),
+                         [(Song, self.songs[0].id)])
+
+
+class SimilarSongTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        _, _, _, cls.songs = create_catalog(3)
+
+    def test_writes_each_shard_as_it_comes(self):
+        top_neighbours = similarity.top_neighbours
+        # Those of the test case itself.
+        blocks = len(connection.savepoint_ids)
+        written = []
+
+        def scored(*args, **kwargs):
+            for rows in top_neighbours(*args, **kwargs):
+                self.assertEqual(len(connection.savepoint_ids), blocks + 1)
+                written.append(SimilarSong.objects.count())
+                yield rows
+
+        with mock.patch.object(similarity, 'top_neighbours', scored):
+            call_command('build_similar_songs', workers=1, shard_size=1,
+                         stdout=io.StringIO())
+
+        # Every song has two neighbours.
+        self.assertEqual(written, [0, 2, 4])
+        self.assertEqual(SimilarSong.objects.count(), 6)
+
+        response = self.client.get('/songs/%d/similar/' % self.songs[0].id)
+        self.assertEqual(len(response.data), 2)
+
+        for url in ('/songs/abc/similar/', '/songs/0/similar/'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class RebuildCommandTests(TestCase):
+
+    def test_rebuilds_bump_the_catalog_version(self):
+        create_catalog(2)
+
+        for command in ('rebuild_song_cards', 'rebuild_search_index',
+                        'build_similar_songs'):
+            version = catalog_version()
+            call_command(command, stdout=io.StringIO())
+            self.assertEqual(catalog_version(), version + 1, command)
+
+        self.assertEqual(SongCard.objects.count(), 2)
+
+
+class SearchTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        create_catalog(2)
+
+    def search(self, data):
+        return self.client.post('/songs/search-song/', data, format='json')
+
+    def test_index_follows_the_catalog(self):
+        song = Song.objects.get(name='Song 0')
+        song.name = 'Wonderwall'
+        song.save()
+        response = self.search({'search_query': 'wonderwall'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [hit['name'] for hit in response.data['results']],
+            ['Wonderwall'])
+
+        song.delete()
+        self.assertEqual(
+            self.search({'search_query': 'wonderwall'}).data['results'], [])
+
+    def test_result_pages_are_cached_per_version(self):
+        query = {'search_query': 'song'}
+        first = self.search(query).data
+
+        with mock.patch.object(SearchEngine, 'search',
+                               side_effect=AssertionError):
+            self.assertEqual(self.search(query).data, first)
+
+        song = Song.objects.get(name='Song 0')
+        song.name = 'Song zero'
+        song.save()
+        self.assertIn('Song zero', [
+            hit['name'] for hit in self.search(query).data['results']])
+
+    def test_autocomplete(self):
+        response = self.client.get('/songs/autocomplete/?q=alb&limit=2')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([album['name'] for album in response.data['albums']],
+                         ['Album 0', 'Album 1'])
+        self.assertEqual(response.data['songs'], [])
+        self.assertEqual(
+            self.client.get('/songs/autocomplete/?q="(').data,
+            {'songs': [], 'albums': [], 'artists': []})
+        self.assertEqual(self.client.get(
+            '/songs/autocomplete/?q=s&limit=x').status_code, 400)
+
+    def test_rejects_missing_or_blank_queries(self):
+        for data in ({}, {'search_query': '  '}, {'search_query': 5},
+                     {'search_query': ['song']}):
+            with self.subTest(data=data):
+                self.assertEqual(self.search(data).status_code, 400)
+
+
+class PlaylistTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        _, _, _, cls.songs = create_catalog(4)
+        cls.playlist = Playlist.objects.create(name='Mine', user=cls.user)
+        playlists.append_tracks(
+            cls.playlist, [song.id for song in cls.songs[:3]])
+
+    def url(self, action=''):
+        return '/playlists/%d/%s' % (self.playlist.id, action)
+
+    def song_ids(self, links):
+        return [int(link.rstrip('/').rsplit('/', 1)[1]) for link in links]
+
+    def order(self):
+        tracks = self.client.get(self.url('tracks/')).data['results']
+        songs = self.client.get(self.url()).data['songs']
+
+        # The embedded links follow the tracks.
+        self.assertEqual(self.song_ids(songs),
+                         self.song_ids(track['song'] for track in tracks))
+
+        return self.song_ids(songs)
+
+    def move(self, song, after):
+        return self.client.put(self.url('move-track/'),
+                               {'song': song, 'after': after}, format='json')
+
+    def test_lists_track_counts(self):
+        Playlist.objects.create(name='Empty', user=self.user)
+        results = {playlist['name']: playlist for playlist in
+                   self.client.get('/playlists/').data['results']}
+
+        self.assertEqual(results['Mine']['tracks'], {
+            'count': 3, 'url': 'http://testserver' + self.url('tracks/')})
+        self.assertEqual(results['Empty']['tracks']['count'], 0)
+        self.assertNotIn('songs', results['Mine'])
+        self.assertEqual(len(self.client.get(self.url()).data['songs']), 3)
+
+    def test_move_track(self):
+        first, second, third = [song.id for song in self.songs[:3]]
+
+        self.assertEqual(self.move(third, None).status_code, 202)
+        self.assertEqual(self.order(), [third, first, second])
+        self.assertEqual(self.move(str(third), str(first)).status_code, 202)
+        self.assertEqual(self.order(), [first, third, second])
+
+        for song, after in ((first, 'abc'), ('abc', None), (None, first),
+                            (self.songs[3].id, first), (first, [second])):
+            with self.subTest(song=song, after=after):
+                self.assertEqual(self.move(song, after).status_code, 400)
+
+    def test_edit_songs_applies_the_diff(self):
+        first, second, third, fourth = [song.id for song in self.songs]
+        response = self.client.put(
+            self.url('edit-songs/'),
+            {'add': [fourth, first, fourth], 'remove': [second, 0]},
+            format='json')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.song_ids(response.data['added']), [fourth])
+        self.assertEqual(self.song_ids(response.data['removed']), [second])
+        self.assertEqual(self.order(), [first, third, fourth])
+        self.assertEqual(self.client.put(
+            self.url('edit-songs/'), {'add': [0]},
+            format='json').status_code, 400)
+
+    def test_large_edits_stay_under_the_parameter_limit(self):
+        album = self.songs[0].album
+        Song.objects.bulk_create(
+            [Song(name='Extra %d' % i, album=album) for i in range(1200)])
+        song_ids = list(Song.objects.filter(
+            name__startswith='Extra').values_list('id', flat=True))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(
+                self.url('edit-songs/'), {'add': song_ids}, format='json')
+            self.client.put(
+                self.url('edit-songs/'), {'remove': song_ids}, format='json')
+
+        self.assertEqual(len(response.data['added']), 1200)
+        self.assertEqual(len(self.order()), 3)
+
+        for query in queries:
+            for ids in re.findall(r' IN \(([^)]*)\)', query['sql']):
+                self.assertLessEqual(ids.count(',') + 1, ID_CHUNK_SIZE)
+
+
+class IngestTests(TestCase):
+
+    def ingest(self, extension, content):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog' + extension)
+
+            with open(path, 'w', encoding='utf-8') as stream:
+                stream.write(content)
+
+            call_command('ingest_catalog', path, stdout=io.StringIO())
+
+    def test_upserts_and_refreshes_derived_data(self):
+        self.ingest('.csv', (
+            'type,id,name,album,genres,song_length,released_on\n'
+            'genre,1,Rock,,,,\n'
+            'album,1,Meteora,,1,,2003-03-25\n'
+            'song,1,Numb,1,1,185,2003-03-25\n'))
+        self.ingest('.json', '{"type": "song", "id": 1, "name": "Faint"}\n')
+
+        song = Song.objects.get(id=1)
+        self.assertEqual((song.name, song.song_length), ('Faint', 185))
+        self.assertEqual(list(song.genres.values_list('name', flat=True)),
+                         ['Rock'])
+        self.assertEqual(SongCard.objects.get(song=song).name, 'Faint')
+        self.assertEqual(
+            [hit.song_id for hit in SearchEngine().search('faint').hits], [1])
+
+    def test_errors_name_the_line(self):
+        for extension, content, line in (
+                ('.csv', 'type,id,song_length\nsong,1,185\nsong,2,long\n',
+                 3),
+                ('.json', '\n{"type": "album", "id": 1, '
+                 '"released_on": "soon"}\n', 2),
+                ('.yaml', '- type: genre\n  id: 1\n  name: Rock\n'
+                 '- type: album\n  id: 2\n  genres: [x]\n', 4),
+                ('.csv', 'type,id\nsong,one\n', 2),
+                # A new song needs an album, which must exist.
+                ('.csv', 'type,id,name\ngenre,1,Rock\nsong,1,Numb\n', 3),
+                ('.csv', 'type,id,name,album\nalbum,1,Meteora,\n'
+                 'song,1,Numb,555\n', 3),
+                ('.json', '{"type": "album", "id": 1, "name": "Meteora", '
+                 '"rating": 9}\n', 1),
+                ('.json', '{"type": "album", "id": 1, "name": "Meteora", '
+                 '"genres": [7]}\n', 1)):
+            with self.subTest(content=content):
+                with self.assertRaisesMessage(
+                        CommandError, 'Line %d: ' % line):
+                    self.ingest(extension, content)
+
+        self.assertFalse(Genre.objects.exists())
+
+    def test_integrity_errors_are_command_errors(self):
+        with mock.patch.object(CatalogIngest, 'finish',
+                               side_effect=IntegrityError('constraint')):
+            with self.assertRaisesMessage(CommandError, 'constraint'):
+                self.ingest('.json', '{"type": "genre", "id": 1, '
+                            '"name": "Rock"}\n')
+
+
+class BulkRecommendationTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        cls.friend = User.objects.create_user('friend', password='secret')
+        genres, albums, _, songs = create_catalog(2)
+        cls.genre, cls.album, cls.song = genres[0], albums[0], songs[0]
+
+    def recommend(self, *items):
+        return self.client.post('/recommendations/bulk/',
+                                {'recommendations': list(items)},
+                                format='json')
+
+    def test_creates_each_pair_once(self):
+        response = self.recommend(
+            {'user': self.friend.id, 'song': self.song.id},
+            {'user': self.friend.id, 'song': self.song.id},
+            {'user': self.friend.id, 'album': self.album.id},
+            {'user': self.user.id, 'genre': self.genre.id})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'created': 3})
+        self.assertEqual(Recommendation.objects.filter(
+            from_user=self.user, for_user=self.friend).count(), 2)
+
+    def test_rejects_the_whole_request(self):
+        for items in (
+                [],
+                [{'user': self.friend.id}],
+                [{'user': self.friend.id, 'song': self.song.id,
+                  'album': self.album.id}],
+                [{'user': self.friend.id, 'song': self.song.id},
+                 {'user': 0, 'song': 0}],
+                [{'user': self.friend.id, 'song': self.song.id}] * 1001):
+            with self.subTest(items=items[:2]):
+                self.assertEqual(self.recommend(*items).status_code, 400)
+
+        self.assertFalse(Recommendation.objects.exists())
+
+    def test_invalidates_the_inbox_of_the_recipients(self):
+        self.client.force_authenticate(self.friend)
+        unread = '/recommendations/unread-count/'
+        self.assertEqual(self.client.get(unread).data,
+                         {'count': 0, 'latest': 0})
+
+        self.client.force_authenticate(self.user)
+        self.recommend({'user': self.friend.id, 'song': self.song.id},
+                       {'user': self.friend.id, 'album': self.album.id})
+
+        self.client.force_authenticate(self.friend)
+        inbox = self.client.get(unread).data
+        self.assertEqual(inbox['count'], 2)
+        self.assertEqual(self.client.get(
+            unread + '?since=%d' % inbox['latest']).data['count'], 0)
+        self.assertEqual(
+            len(self.client.get('/recommendations/').data['results']), 2)
+
+
+class InboxTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        cls.friend = User.objects.create_user('friend', password='secret')
+        _, _, _, cls.songs = create_catalog(1)
+
+        # Three days, so pages split runs of the same date.
+        for i in range(15):
+            cls.recommend(datetime.date(2020, 1, 1 + i % 3))
+
+    @classmethod
+    def recommend(cls, recommended_on, for_user=None):
+        return Recommendation.objects.create(
+            from_user=cls.friend, for_user=for_user or cls.user,
+            song=cls.songs[0], recommended_on=recommended_on).id
+
+    def page(self, url):
+        data = self.client.get(url).data
+
+        return [int(item['url'].rstrip('/').rsplit('/', 1)[1])
+                for item in data['results']], data['next']
+
+    def test_a_new_arrival_between_pages(self):
+        expected = list(Recommendation.objects.filter(
+            for_user=self.user).order_by(
+                '-recommended_on', '-id').values_list('id', flat=True))
+        first, next_page = self.page('/recommendations/')
+        self.assertEqual(first, expected[:10])
+
+        # Sorts before the cursor, so it waits for the first page, and one
+        # sorting after it shows up where it belongs.
+        newest = self.recommend(datetime.date(2020, 2, 1))
+        oldest = self.recommend(datetime.date(2019, 12, 31))
+        second, next_page = self.page(next_page)
+        self.assertEqual(second, expected[10:] + [oldest])
+        self.assertIsNone(next_page)
+        self.assertEqual(self.page('/recommendations/')[0][0], newest)
+
+    def test_unread_count_since(self):
+        unread = '/recommendations/unread-count/'
+        latest = self.client.get(unread).data['latest']
+        self.assertEqual(self.client.get(unread + '?since=%d' % latest).data,
+                         {'count': 0, 'latest': latest})
+
+        # Ids, not dates, tell what arrived since: a back dated
+        # recommendation is still unread, those of others never are.
+        self.recommend(datetime.date(2020, 1, 1), for_user=self.friend)
+        arrived = self.recommend(datetime.date(2019, 1, 1))
+        self.assertEqual(self.client.get(unread + '?since=%d' % latest).data,
+                         {'count': 1, 'latest': arrived})
+        self.assertEqual(self.client.get(unread).data['count'], 16)
+        self.assertEqual(
+            self.client.get(unread + '?since=soon').status_code, 400)
+
+
+class SmartPlaylistTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        cls.genres, _, _, cls.songs = create_catalog(3)
+        Song.objects.filter(id=cls.songs[0].id).update(rating=5)
+        Song.objects.filter(id=cls.songs[1].id).update(song_length=400)
+
+    def song_ids(self, playlist_id):
+        return set(PlaylistTrack.objects.filter(
+            playlist_id=playlist_id).values_list('song_id', flat=True))
+
+    def test_compiles_rules(self):
+        genre = self.genres[0].id
+
+        for rules, expected in (
+                ({'conditions': [{'field': 'rating', 'op': 'gte',
+                                  'value': 4}]}, [0]),
+                ({'match': 'any', 'conditions': [
+                    {'field': 'rating', 'op': 'eq', 'value': 5},
+                    {'field': 'length', 'op': 'gt', 'value': 300}]}, [0, 1]),
+                ({'conditions': [
+                    {'field': 'genre', 'op': 'in', 'value': [genre]},
+                    {'field': 'released_on', 'op': 'lte',
+                     'value': '2000-01-01'}]}, [])):
+            with self.subTest(rules=rules):
+                self.assertEqual(
+                    set(smart_playlists.songs_matching(rules).values_list(
+                        'id', flat=True)),
+                    {self.songs[i].id for i in expected})
+
+        for rules in (
+                [], {'conditions': []}, {'match': 'most', 'conditions': [
+                    {'field': 'rating', 'op': 'eq', 'value': 5}]},
+                {'conditions': [{'field': 'mood', 'op': 'eq', 'value': 1}]},
+                {'conditions': [{'field': 'genre', 'op': 'gt',
+                                 'value': [genre]}]},
+                {'conditions': [{'field': 'rating', 'op': 'eq',
+                                 'value': True}]},
+                {'conditions': [{'field': 'released_on', 'op': 'eq',
+                                 'value': 'soon'}]}):
+            with self.subTest(rules=rules):
+                with self.assertRaises(smart_playlists.RuleError):
+                    smart_playlists.compile_rules(rules)
+
+    def test_membership_follows_rules_and_songs(self):
+        rules = {'conditions': [{'field': 'rating', 'op': 'gte', 'value': 4}]}
+        response = self.client.post(
+            '/playlists/', {'name': 'Best', 'rules': rules}, format='json')
+        self.assertEqual(response.status_code, 201)
+        playlist_id = Playlist.objects.get(name='Best').id
+        self.assertEqual(self.song_ids(playlist_id), {self.songs[0].id})
+
+        # 5 and 1 average to 3.
+        with run_on_commit():
+            record_ratings(Song, {self.songs[0].id: (6, 2)})
+            record_ratings(Song, {self.songs[2].id: (4, 1)})
+        self.assertEqual(self.song_ids(playlist_id), {self.songs[2].id})
+
+        rules['conditions'][0]['field'] = 'length'
+        response = self.client.put('/playlists/%d/rules/' % playlist_id,
+                                   {'rules': rules}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.song_ids(playlist_id),
+                         {song.id for song in self.songs})
+
+        self.assertEqual(self.client.post(
+            '/playlists/', {'name': 'Bad', 'rules': {'conditions': []}},
+            format='json').status_code, 400)
+
+    def test_refreshes_only_playlists_of_changed_fields(self):
+        for name, field, value in (('Loved', 'rating', 4),
+                                   ('Long', 'length', 300)):
+            self.client.post('/playlists/', {'name': name, 'rules': {
+                'conditions': [{'field': field, 'op': 'gte',
+                                'value': value}]}}, format='json')
+
+        loved, long = [Playlist.objects.get(name=name)
+                       for name in ('Loved', 'Long')]
+        Playlist.objects.create(name='Plain', user=self.user)
+        self.assertEqual(set(Playlist.objects.filter(
+            is_smart=True).values_list('name', flat=True)), {'Loved', 'Long'})
+
+        # One flag per smart playlist in the query testing the songs.
+        with CaptureQueriesContext(connection) as queries, run_on_commit():
+            record_ratings(Song, {self.songs[2].id: (5, 1)})
+        flags = [query['sql'] for query in queries.captured_queries
+                 if 'smart_' in query['sql']]
+        self.assertEqual(len(flags), 1)
+        self.assertIn('smart_%d' % loved.id, flags[0])
+        self.assertNotIn('smart_%d' % long.id, flags[0])
+        self.assertIn(self.songs[2].id, self.song_ids(loved.id))
+
+        song = Song.objects.get(id=self.songs[2].id)
+        song.name = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            song.save(update_fields=['name'])
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'smart_' in query['sql']])
+
+        response = self.client.put('/playlists/%d/rules/' % long.id,
+                                   {'rules': None}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Playlist.objects.get(id=long.id).is_smart)
+
+
+class SuggestionTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        rock, jazz = [Genre.objects.create(name=name)
+                      for name in ('Rock', 'Jazz')]
+        first, second = [Album.objects.create(name=name)
+                         for name in ('First', 'Second')]
+        cls.songs = {}
+
+        for name, album, genre in (('Liked', first, rock),
+                                   ('Same album', first, rock),
+                                   ('Same genre', second, rock),
+                                   ('Unrelated', second, jazz)):
+            song = Song.objects.create(name=name, album=album)
+            song.genres.set([genre])
+            cls.songs[name] = song
+
+        cls.playlist = Playlist.objects.create(name='Mine', user=cls.user)
+        playlists.append_tracks(cls.playlist, [cls.songs['Liked'].id])
+
+    def setUp(self):
+        super().setUp()
+        # The matrix outlives the catalog of a test.
+        patcher = mock.patch.dict(suggestions._features, version=None,
+                                  matrix=None, rebuilder=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_best_matches_first(self):
+        response = self.client.get(
+            '/playlists/%d/suggestions/' % self.playlist.id)
+
+        self.assertEqual(response.status_code, 200)
+        # Songs sharing nothing are never suggested.
+        self.assertEqual([song['name'] for song in response.data],
+                         ['Same album', 'Same genre'])
+        self.assertGreater(response.data[0]['score'],
+                           response.data[1]['score'])
+        self.assertEqual(len(self.client.get(
+            '/playlists/%d/suggestions/?limit=1' % (
+                self.playlist.id)).data), 1)
+
+    def names(self):
+        return [Song.objects.get(id=pk).name for pk, _ in
+                suggestions.suggest_for_playlist(self.playlist)]
+
+    @mock.patch.object(suggestions.threading, 'Thread')
+    def test_serves_the_previous_matrix_until_rebuilt(self, thread):
+        self.assertEqual(self.names(), ['Same album', 'Same genre'])
+        thread.assert_not_called()
+
+        # Deleted songs go at once, new ones wait for the rebuild.
+        Song.objects.get(name='Same genre').delete()
+        Song.objects.create(name='Newcomer', album=Album.objects.get(
+            name='First'))
+        self.assertEqual(self.names(), ['Same album'])
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once_with()
+
+        # A single rebuild at a time.
+        self.names()
+        thread.assert_called_once()
+
+        suggestions.rebuild_features()
+        self.assertEqual(self.names(), ['Same album', 'Newcomer'])
+
+
+class ExportTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        cls.friend = User.objects.create_user('friend', password='secret')
+        _, _, _, cls.songs = create_catalog(3)
+        cls.playlist = Playlist.objects.create(name='Mine', user=cls.user)
+        playlists.append_tracks(
+            cls.playlist, [song.id for song in reversed(cls.songs)])
+        Playlist.objects.create(name='Theirs', user=cls.friend)
+        Recommendation.objects.create(
+            from_user=cls.friend, for_user=cls.user, song=cls.songs[0])
+
+    def records(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        return [json.loads(line) for line in b''.join(
+            response.streaming_content).decode().splitlines()]
+
+    def test_catalog_round_trips_through_ingest(self):
+        with mock.patch.object(export, 'CHUNK_SIZE', 2):
+            records = self.records('/export/catalog/')
+
+        self.assertEqual(
+            [record['type'] for record in records],
+            ['genre'] * 3 + ['album'] * 3 + ['song'] * 3 + ['artist'] * 3)
+        self.assertEqual(records[-1]['songs'],
+                         [song.id for song in self.songs])
+
+        Song.objects.update(name='Renamed')
+        Artist.songs.through.objects.all().delete()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.ndjson')
+
+            with open(path, 'w', encoding='utf-8') as stream:
+                stream.writelines(json.dumps(record) + '\n'
+                                  for record in records)
+
+            call_command('ingest_catalog', path, stdout=io.StringIO())
+
+        self.assertEqual(self.records('/export/catalog/'), records)
+
+    def test_library_of_the_requesting_user(self):
+        records = self.records('/export/library/')
+
+        self.assertEqual([(record['type'], record.get('name'))
+                          for record in records],
+                         [('playlist', 'Mine'), ('recommendation', None)])
+        self.assertEqual(records[0]['songs'],
+                         [song.id for song in reversed(self.songs)])
+
+
+class ConditionalGetTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        create_catalog(3)
+
+    def test_not_modified_until_the_catalog_changes(self):
+        response = self.client.get('/genres/')
+        etag = response['ETag']
+
+        # Only the catalog version is read.
+        with self.assertNumQueries(1):
+            response = self.client.get('/genres/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(
+            '/genres/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        Genre.objects.create(name='New genre')
+        response = self.client.get('/genres/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_ratings_only_change_rated_responses(self):
+        song = Song.objects.first()
+        urls = ('/songs/', '/songs/%d/' % song.id, '/albums/', '/genres/')
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        version = catalog_version()
+
+        record_ratings(Song, {song.id: (4, 1)})
+        self.assertEqual(catalog_version(), version)
+
+        for url in urls:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code,
+                             304 if url == '/genres/' else 200, url)
+
+        self.assertEqual(self.client.get(
+            '/songs/%d/' % song.id).data['reviewers'], 1)
+
+
+class ResponseCacheTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        cls.friend = User.objects.create_user('friend', password='secret')
+        _, _, _, cls.songs = create_catalog(3)
+        cls.playlist = Playlist.objects.create(name='Mine', user=cls.user)
+        cls.other = Playlist.objects.create(name='Theirs', user=cls.friend)
+
+    def test_catalog_responses_are_shared(self):
+        self.client.get('/albums/')
+        self.client.force_authenticate(self.friend)
+
+        # Only the catalog version is read.
+        with self.assertNumQueries(1):
+            response = self.client.get('/albums/')
+
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_user_entries_are_invalidated_alone(self):
+        mine = '/playlists/%d/' % self.playlist.id
+        theirs = '/playlists/%d/' % self.other.id
+        self.client.get(mine)
+        self.client.get(theirs)
+
+        with self.assertNumQueries(2):
+            self.client.get(mine)
+
+        self.client.put(mine + 'edit-songs/', {'add': [self.songs[0].id]},
+                        format='json')
+        self.assertEqual(len(self.client.get(mine).data['songs']), 1)
+
+        with self.assertNumQueries(2):
+            self.client.get(theirs)
+
+    def test_plain_song_relations_invalidate_the_owner(self):
+        mine = '/playlists/%d/' % self.playlist.id
+
+        for change, count in (
+                (lambda: self.playlist.songs.add(*self.songs[:2]), 2),
+                (lambda: self.playlist.songs.remove(self.songs[0]), 1),
+                (lambda: self.songs[2].playlists.add(self.playlist), 2),
+                (lambda: self.songs[2].playlists.clear(), 1),
+                (lambda: self.playlist.songs.clear(), 0)):
+            self.client.get(mine)
+            change()
+            self.assertEqual(len(self.client.get(mine).data['songs']), count)
+
+
+class FastPathTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        _, _, _, songs = create_catalog(12)
+        cls.song = songs[0]
+
+    def render(self, url, fast):
+        response_cache().clear()
+
+        with override_settings(FAST_SERIALIZERS=fast):
+            return self.client.get(url).content
+
+    def test_renders_the_same_bytes(self):
+        next_page = self.client.get('/albums/').data['next']
+
+        for url in ('/albums/', next_page, '/albums.json',
+                    '/songs/%d/' % self.song.id, '/songs/0/'):
+            self.assertEqual(self.render(url, True), self.render(url, False))
+
+
+class LengthTests(ClientTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        _, cls.albums, _, cls.songs = create_catalog(3)
+        Song.objects.filter(id=cls.songs[1].id).update(song_length=150)
+        Song.objects.create(name='Bonus', album=cls.albums[0], song_length=90)
+        Album.objects.filter(id=cls.albums[2].id).update(album_length=1800)
+        rebuild_cards()
+        cls.playlist = Playlist.objects.create(name='Mine', user=cls.user)
+        cls.playlist.songs.set(cls.songs)
+
+    def names(self, url):
+        return [item['name'] for item in self.client.get(url).data['results']]
+
+    def test_length_ranges(self):
+        self.assertEqual(self.names('/songs/?max_length=150'),
+                         ['Song 1', 'Bonus'])
+        self.assertEqual(self.names('/songs/?min_length=100&max_length=200'),
+                         ['Song 1'])
+        self.assertEqual(self.names('/albums/?max_length=2000'), ['Album 2'])
+        self.assertEqual(
+            self.client.get('/songs/?min_length=-1').status_code, 400)
+
+    def test_total_lengths(self):
+        album = self.client.get('/albums/%d/' % self.albums[0].id).data
+        playlist = self.client.get('/playlists/%d/' % self.playlist.id).data
+
+        self.assertEqual(album['total_length'], 210 + 90)
+        self.assertEqual(playlist['total_length'], 210 + 150 + 210)
+
+
+class ListFilterTests(ClientTestCase):
+    # Every supported filter, alone and in the combinations backed by a
+    # composite index.
+    FILTERS = [
+        'genre=%(genre)d', 'artist=%(artist)d', 'rating=4',
+        'released_after=2020-01-02', 'released_before=2020-01-02',
+        'released_after=2020-01-01&released_before=2020-01-02',
+        'min_length=200', 'max_length=200',
+        'rating=4&released_after=2020-01-02', 'rating=4&max_length=200',
+        'genre=%(genre)d&rating=4',
+        'artist=%(artist)d&released_before=2020-01-02',
+        'rating=4&ordering=released_on', 'rating=4&ordering=-length',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='secret')
+        genres, albums, artists, songs = create_catalog(3)
+        cls.genre, cls.artist = genres[0], artists[0]
+
+        for i, (album, song) in enumerate(zip(albums, songs)):
+            released_on = datetime.date(2020, 1, 1 + i)
+            Album.objects.filter(id=album.id).update(
+                rating=3 + i % 2, released_on=released_on)
+            Song.objects.filter(id=song.id).update(
+                rating=3 + i % 2, released_on=released_on,
+                song_length=180 + 30 * i)
+
+        rebuild_cards()
+
+    def names(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        return [item['name'] for item in response.data['results']]
+
+    def test_filters_and_orderings(self):
+        self.assertEqual(self.names('/songs/?rating=4'), ['Song 1'])
+        self.assertEqual(
+            self.names('/songs/?genre=%d&released_after=2020-01-02' % (
+                self.genre.id)), ['Song 2', 'Song 1'])
+        self.assertEqual(self.names('/songs/?ordering=length'),
+                         ['Song 0', 'Song 1', 'Song 2'])
+        self.assertEqual(self.names('/albums/?ordering=-rating'),
+                         ['Album 1', 'Album 2', 'Album 0'])
+        self.assertEqual(
+            self.names('/albums/?artist=%d&released_before=2020-01-02' % (
+                self.artist.id)), ['Album 1', 'Album 0'])
+
+        for url in ('/songs/?rating=9', '/albums/?released_after=soon',
+                    '/albums/?ordering=name', '/songs/?genre=x'):
+            self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_no_filter_scans_a_table(self):
+        for params in self.FILTERS:
+            for url in ('/songs/?', '/albums/?'):
+                url += params % {'genre': self.genre.id,
+                                 'artist': self.artist.id}
+
+                with self.subTest(url=url):
+                    response_cache().clear()
+
+                    with CaptureQueriesContext(connection) as queries:
+                        self.names(url)
+
+                    with connection.cursor() as cursor:
+                        for query in queries:
+                            cursor.execute(
+                                'EXPLAIN QUERY PLAN ' + query['sql'])
+
+                            for *_, detail in cursor.fetchall():
+                                self.assertFalse(
+                                    detail.startswith('SCAN'),
+                                    '%s: %s' % (detail, query['sql']))
+
+
+class SQLiteProfileTests(TestCase):
+
+    def connect(self, name):
+        wrapper = connections[DEFAULT_DB_ALIAS].__class__(
+            dict(connection.settings_dict, NAME=name), 'profile')
+        self.addCleanup(wrapper.close)
+
+        return wrapper.cursor()
+
+    def test_new_connections_apply_the_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'db.sqlite3')
+
+            with self.connect(path) as cursor:
+                for name, value in (
+                        ('journal_mode', 'wal'),
+                        ('busy_timeout',
+                         settings.SQLITE_PRAGMAS['busy_timeout'])):
+                    cursor.execute('PRAGMA %s' % name)
+                    self.assertEqual(cursor.fetchone()[0], value)
+
+                cursor.execute('CREATE TABLE song (name TEXT)')
+
+            # The journal mode is left to the writable connection.
+            with self.connect('file:%s?mode=ro' % path) as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+
+                with self.assertRaises(OperationalError):
+                    cursor.execute("INSERT INTO song VALUES ('Numb')")
+
+
+class CatalogRoutingTests(TransactionTestCase):
+    databases = {'default', 'catalog'}
+
+    def setUp(self):
+        response_cache().clear()
+        self.user = User.objects.create_user('listener', password='secret')
+        _, _, _, songs = create_catalog(2)
+        self.song = songs[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def queries(self, method, url, data=None):
+        """Queries run on the default and on the catalog connections."""
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as default:
+            with CaptureQueriesContext(connections['catalog']) as catalog:
+                response = getattr(self.client, method)(
+                    url, data, format='json')
+
+        self.assertLess(response.status_code, 300)
+
+        return len(default), len(catalog)
+
+    def test_catalog_reads_use_the_catalog_connection(self):
+        rate = '/songs/%d/rate-song/' % self.song.id
+
+        for url in ('/songs/', '/albums/', '/genres/', '/artists/', rate):
+            default, catalog = self.queries('get', url)
+            self.assertEqual(default, 0, url)
+            self.assertGreater(catalog, 0, url)
+
+        self.assertEqual(self.queries(
+            'post', '/songs/search-song/', {'search_query': 'Song'})[0], 0)
+        self.assertEqual(self.queries('put', rate, {'rating': 4})[1], 0)
+        self.assertEqual(self.queries('get', '/playlists/')[1], 0)
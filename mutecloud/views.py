@@ -1,33 +1,316 @@
-import os
-import sqlite3
-
 from django.conf import settings
-from django.contrib.auth.models import User
-from django.db import transaction
+from django.contrib.auth.models import Group, User
+from django.db import router, transaction
+from django.db.models import (Count, F, Max, OuterRef, Prefetch, Subquery,
+                              Sum)
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework.decorators import action
-from rest_framework.exceptions import MethodNotAllowed
-from rest_framework import permissions, renderers
+from rest_framework.exceptions import (MethodNotAllowed, NotFound,
+                                       ValidationError)
+from rest_framework import generics, permissions, renderers
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework import status
 from rest_framework import viewsets
 
 from mutecloud.models import (Song, Playlist, Album, Genre,
-                              Recommendation, Artist)
+                              Recommendation, Artist, PlaylistTrack, SongCard)
 from mutecloud.serializers import (UserSerializer, SongSerializer,
-                                   PlaylistSerializer, GenreSerializer,
+                                   PlaylistSerializer,
+                                   PlaylistListSerializer, GenreSerializer,
                                    AlbumSerializer, RecommendationSerializer,
-                                   ArtistSerializer)
+                                   ArtistSerializer, LinkSerializer,
+                                   BulkRecommendationSerializer,
+                                   PlaylistTrackSerializer,
+                                   PlaylistEditSerializer,
+                                   SongCardSerializer,
+                                   requested_fields, relations_mode,
+                                   RELATIONS_COUNT)
+from mutecloud import (export, playlists, ratings, response_cache,
+                       similarity, smart_playlists, suggestions)
+from mutecloud.catalog import catalog_state
+from mutecloud.database import write_transaction
+from mutecloud.fastpath import AlbumFastSerializer, SongFastSerializer
+from mutecloud.filters import AlbumListFilter, SongListFilter
+from mutecloud.pagination import KeysetPagination
+from mutecloud.routers import catalog_reads
+from mutecloud.search import (SearchEngine, SearchQueryError, complete,
+                              normalize_query, result_cache,
+                              COMPLETION_LIMIT, COMPLETION_MAX_LIMIT)
+
+
+def prefetch_links(**relations):
+    """Prefetch many to many relations rendered as hyperlinks.
+
+    A hyperlink only needs the primary key of the related object, so only
+    that column is loaded, in one query per relation for the whole page,
+    in id order.
+    """
+    return [Prefetch(name, queryset=model.objects.only('id').order_by('id'))
+            for name, model in relations.items()]
+
+
+def relation_count(model, name):
+    """Count the rows of the to-many relation `name` of `model`.
+
+    A correlated subquery per relation, so counting several relations of
+    the same object never multiplies their joins.
+    """
+    field = model._meta.get_field(name)
+
+    if field.concrete:
+        through, column = field.remote_field.through, field.m2m_field_name()
+    else:
+        through, column = field.through, field.field.m2m_reverse_field_name()
+
+    counts = through.objects.filter(**{column: OuterRef('pk')}).order_by(
+        ).values(column).annotate(count=Count('*')).values('count')
+
+    return Coalesce(Subquery(counts), 0)
+
+
+def total_length(queryset, owner, length):
+    """Sum the `length` (seconds) of the rows of `queryset` pointing at each
+    object through `owner`, as a correlated subquery.
+    """
+    totals = queryset.filter(**{owner: OuterRef('pk')}).order_by().values(
+        owner).annotate(total=Sum(length)).values('total')
+
+    return Coalesce(Subquery(totals), 0)
+
+
+class EarlyResponse(Exception):
+    """Short-circuits a request answered before its handler runs."""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ResponseCacheMixin:
+    """Stores the data of successful GET responses in the response cache.
+
+    Subclasses look a request up with `serve_cached()` from `initial()`. A
+    hit skips every query of the view and the serializer, a miss is stored
+    under the same key once the view has answered.
+    """
+
+    def serve_cached(self, request, key):
+        cached = response_cache.response_cache().get(key)
+
+        if cached is not None:
+            raise EarlyResponse(Response(cached, status=status.HTTP_200_OK))
+
+        self.response_cache_key = key
+
+    def handle_exception(self, exc):
+        if isinstance(exc, EarlyResponse):
+            return exc.response
+
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        key = getattr(self, 'response_cache_key', None)
+
+        if key is not None and response.status_code == status.HTTP_200_OK:
+            response_cache.response_cache().set(
+                key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+
+        return response
+
+
+class CatalogReadsMixin:
+    """Serves the safe requests of a catalog view, and its `read_actions`,
+    from the read-only catalog connection, see `mutecloud.routers`.
+    """
+    read_actions = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        action = self.action_map.get(request.method.lower())
+
+        if request.method not in permissions.SAFE_METHODS and (
+                action not in self.read_actions):
+            return super().dispatch(request, *args, **kwargs)
+
+        with catalog_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class CatalogConditionalMixin(ResponseCacheMixin):
+    """Conditional GET and shared response cache for the read only catalog
+    endpoints.
+
+    Every response carries an ETag and a Last-Modified built from the
+    catalog version, and a request whose `If-None-Match` or
+    `If-Modified-Since` still matches is answered with a 304 right after
+    authentication, before any query of the view or any serialization.
+    Other responses are cached once for all users, per catalog version.
+    Views that `shows_ratings` also go by the ratings version.
+    """
+    shows_ratings = False
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.catalog_validators = None
+
+        if request.method in ('GET', 'HEAD'):
+            version, updated_on = catalog_state(ratings=self.shows_ratings)
+            # The browsable API renders the same version differently.
+            self.catalog_validators = (
+                'W/"%s-%s"' % (version, request.accepted_renderer.format),
+                updated_on and int(updated_on.timestamp()))
+            response = get_conditional_response(
+                request,
+                etag=self.catalog_validators[0],
+                last_modified=self.catalog_validators[1])
+
+            if response is not None:
+                raise EarlyResponse(response)
+
+            self.serve_cached(request, response_cache.cache_key(
+                'catalog', version, request.build_absolute_uri()))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        validators = getattr(self, 'catalog_validators', None)
+
+        if validators and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response['ETag'] = etag
+
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+
+        return response
+
+
+class UserCacheMixin(ResponseCacheMixin):
+    """Response cache of endpoints showing the data of a single user.
+
+    The GET actions of `user_cached_actions` are cached per owner of the
+    data, under the owner's generation and the catalog version, and the
+    ratings version for `rated_actions`. Changing anything of a user bumps
+    their generation, which orphans all of their entries and no one
+    else's.
+    """
+    user_cached_actions = ()
+    rated_actions = ()
+
+    def cache_owner(self, request, pk=None):
+        """Id of the user whose data the request shows."""
+        return request.user.id
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        if request.method in ('GET', 'HEAD') and (
+                self.action in self.user_cached_actions):
+            owner = self.cache_owner(request, kwargs.get('pk'))
+
+            if owner is not None:
+                version, _ = catalog_state(
+                    ratings=self.action in self.rated_actions)
+                self.serve_cached(request, response_cache.cache_key(
+                    'user', owner, response_cache.user_generation(owner),
+                    version, request.build_absolute_uri()))
+
+
+class SparseRelationsMixin:
+    """Loads only the relations a `?fields=` / `?relations=` request renders.
+
+    Relations rendered as hyperlinks are prefetched, counted relations are
+    annotated, and any other relation is not touched at all. Each relation
+    is also paged through by its own `/<object>/<id>/<relation>/` action.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset().prefetch_related(None)
+        model = queryset.model
+        fields = requested_fields(self.request)
+        relations = [
+            name for name in self.get_serializer_class().Meta.counted_relations
+            if fields is None or name in fields]
+
+        if relations_mode(self.request) == RELATIONS_COUNT:
+            return queryset.annotate(**{
+                '%s_count' % name: relation_count(model, name)
+                for name in relations})
+
+        return queryset.prefetch_related(*prefetch_links(**{
+            name: model._meta.get_field(name).related_model
+            for name in relations}))
+
+    def relation_page(self, pk, name):
+        instance = get_object_or_404(
+            self.queryset.model.objects.only('id'), pk=pk)
+        page = self.paginate_queryset(
+            getattr(instance, name).only('id', 'name').order_by('id'))
+        serializer = LinkSerializer(
+            page,
+            context=self.get_serializer_context(),
+            many=True)
+
+        return self.get_paginated_response(serializer.data)
+
+
+def rating_from(request):
+    """The rating of a rate request, an integer from 1 to 5."""
+    try:
+        rating = int(request.data.get('rating'))
+    except (TypeError, ValueError):
+        rating = None
+
+    if rating is None or not (
+            ratings.MIN_RATING <= rating <= ratings.MAX_RATING):
+        raise ValidationError({'rating': 'Must be an integer from %d to %d.' % (
+            ratings.MIN_RATING, ratings.MAX_RATING)})
+
+    return rating
+
+
+def rules_from(request):
+    """The smart playlist rules of a request, checked, or None to drop them."""
+    rules = request.data.get('rules')
+
+    if rules is not None:
+        try:
+            smart_playlists.compile_rules(rules)
+        except smart_playlists.RuleError as e:
+            raise ValidationError({'rules': str(e)})
+
+    return rules
+
+
+COMPLETION_VIEW_NAMES = {
+    'songs': 'song-detail',
+    'albums': 'album-detail',
+    'artists': 'artist-detail',
+}
 
 
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all().order_by('-date_joined')
+    queryset = User.objects.prefetch_related(
+        *prefetch_links(groups=Group)).order_by('-date_joined')
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
-class SongViewSet(viewsets.ModelViewSet):
-    queryset = Song.objects.all().order_by('-id')
+class SongViewSet(CatalogReadsMixin, CatalogConditionalMixin,
+                  viewsets.ModelViewSet):
+    queryset = Song.objects.prefetch_related(
+        *prefetch_links(genres=Genre)).order_by('-id')
     serializer_class = SongSerializer
+    pagination_class = KeysetPagination
+    # A POST that only reads.
+    read_actions = ('search_song',)
+    shows_ratings = True
     permission_classes = [permissions.IsAuthenticated]
 
     def get_renderers(self):
@@ -42,6 +325,27 @@ class SongViewSet(viewsets.ModelViewSet):
 
         return [renderer() for renderer in rends]
 
+    def list(self, request):
+        # One row per song, straight from the denormalized cards.
+        page = self.paginate_queryset(SongListFilter(
+            request.query_params).filter(SongCard.objects))
+        cards_serializer = SongCardSerializer(
+            page,
+            context={'request': request},
+            many=True)
+
+        return self.get_paginated_response(cards_serializer.data)
+
+    def retrieve(self, request, pk=None, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().retrieve(request, pk=pk, **kwargs)
+
+        row = generics.get_object_or_404(
+            SongFastSerializer.rows(self.queryset), id=pk)
+
+        return Response(SongFastSerializer(
+            request, self.format_kwarg).serialize([row])[0])
+
     def create(self, request, *args, **kwargs):
         raise MethodNotAllowed(request.method)
 
@@ -55,41 +359,138 @@ class SongViewSet(viewsets.ModelViewSet):
         raise MethodNotAllowed(request.method)
 
     @action(detail=False, url_path='search-song', methods=['get', 'post'])
-    @transaction.atomic
     def search_song(self, request, pk=None, **kwargs):
         data = {}
 
         if request.method == 'POST':
-            conn = sqlite3.connect(
-                os.path.join(settings.BASE_DIR, "db.sqlite3"))
-            query = "SELECT * FROM search_song WHERE search_song MATCH ? ORDER BY rank"
-            arg = (request.data['search_query'],)
-            result = conn.execute(query, arg)
-            songs = self.queryset.filter(
-                id__in=set(map(lambda x: x[0], result.fetchall())))
-            serializer = self.serializer_class(
-                songs,
-                context={'request': request},
-                many=True)
-            data = serializer.data
+            page = request.data.get(
+                'page', request.query_params.get('page', 1))
+
+            try:
+                page = int(page)
+            except (TypeError, ValueError):
+                page = 0
+
+            if page < 1:
+                raise ValidationError({'page': 'Must be a positive integer.'})
+
+            query = request.data.get('search_query')
+            query = normalize_query(query) if isinstance(query, str) else ''
+
+            if not query:
+                raise ValidationError(
+                    {'search_query': 'Must be a non-blank string.'})
+
+            # One snapshot for the version, the index and the cards.
+            with transaction.atomic(using=router.db_for_read(SongCard)):
+                cache_key = (catalog_state(ratings=True)[0],
+                             request.build_absolute_uri('/'), query, page)
+                data = result_cache.get(cache_key)
+
+                if data is None:
+                    data = self._search_page(request, query, page)
+                    result_cache.set(cache_key, data)
+
+        return Response(
+            status=status.HTTP_200_OK,
+            data=data)
+
+    def _search_page(self, request, query, page):
+        try:
+            result = SearchEngine(
+                using=router.db_for_read(SongCard)).search(query, page=page)
+        except SearchQueryError as error:
+            raise ValidationError({'search_query': str(error)})
+
+        songs = SongCard.objects.in_bulk(
+            [hit.song_id for hit in result.hits])
+        hits = [hit for hit in result.hits if hit.song_id in songs]
+        serializer = SongCardSerializer(
+            [songs[hit.song_id] for hit in hits],
+            context={'request': request},
+            many=True)
+
+        results = serializer.data
+
+        for song_data, hit in zip(results, hits):
+            song_data['highlights'] = hit.highlights
+
+        return {
+            'page': page,
+            'next': page + 1 if result.has_next else None,
+            'previous': page - 1 if page > 1 else None,
+            'results': results,
+        }
+
+    @action(detail=False, url_path='autocomplete', methods=['get'])
+    def autocomplete(self, request, pk=None, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', COMPLETION_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+
+        completions = complete(
+            request.query_params.get('q', ''),
+            limit=max(1, min(limit, COMPLETION_MAX_LIMIT)),
+            using=router.db_for_read(Song))
+        data = {
+            kind: [
+                {'id': pk,
+                 'name': name,
+                 'url': reverse(COMPLETION_VIEW_NAMES[kind], args=[pk],
+                                request=request)}
+                for pk, name in names]
+            for kind, names in completions.items()}
 
         return Response(
             status=status.HTTP_200_OK,
             data=data)
 
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None, **kwargs):
+        try:
+            limit = int(request.query_params.get(
+                'limit', similarity.NEIGHBOURS))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+
+        try:
+            song_id = int(pk)
+        except ValueError:
+            raise NotFound()
+
+        # Precomputed by the build_similar_songs command, read in rank
+        # order straight from the (song, rank) index.
+        neighbours = list(self.queryset.filter(
+            neighbour_of__song_id=song_id).annotate(
+                score=F('neighbour_of__score')).order_by(
+                    'neighbour_of__rank')[:max(1, min(
+                        limit, similarity.NEIGHBOURS))])
+
+        if not neighbours:
+            get_object_or_404(Song.objects.only('id'), id=song_id)
+
+        results = self.serializer_class(
+            neighbours,
+            context={'request': request},
+            many=True).data
+
+        for song_data, song in zip(results, neighbours):
+            song_data['score'] = round(song.score, 4)
+
+        return Response(
+            status=status.HTTP_200_OK,
+            data=results)
+
     @action(detail=True, url_path='rate-song', methods=['get', 'put'])
-    @transaction.atomic
     def rate_song(self, request, pk=None, **kwargs):
-        song = self.queryset.get(id=pk)
-
         if request.method == 'PUT':
-            numerator = (song.rating * song.reviewers) + request.data['rating']
-            denominator = song.reviewers + 1
-            new_rating = numerator // denominator
-            song.rating = new_rating
-            song.reviewers += 1
-            song.save()
+            # A buffered rating is only written later, check the song now.
+            rated = generics.get_object_or_404(
+                Song.objects.only('id'), id=pk)
+            ratings.rate(Song, rated.pk, rating_from(request))
 
+        song = generics.get_object_or_404(self.queryset, id=pk)
         song_serializer = self.serializer_class(
             song,
             context={'request': request})
@@ -99,7 +500,7 @@ class SongViewSet(viewsets.ModelViewSet):
             data=song_serializer.data)
 
     @action(detail=True, url_path='recommend-song', methods=['put'])
-    @transaction.atomic
+    @write_transaction()
     def recommend_song(self, request, pk=None, **kwargs):
         song = self.queryset.get(id=pk)
         resp_status = status.HTTP_200_OK
@@ -121,10 +522,13 @@ class SongViewSet(viewsets.ModelViewSet):
             data=song_serializer.data)
 
 
-class RecommendationViewSet(viewsets.ModelViewSet):
+class RecommendationViewSet(UserCacheMixin, viewsets.ModelViewSet):
     queryset = Recommendation.objects.all().order_by('-id')
     serializer_class = RecommendationSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticated]
+    # The inbox of the requesting user.
+    user_cached_actions = ('list', 'unread_count')
 
     def get_renderers(self):
         rends = [renderers.JSONRenderer]
@@ -136,21 +540,71 @@ class RecommendationViewSet(viewsets.ModelViewSet):
 
     def list(self, request):
         recommendations = self.queryset.filter(
-            for_user=request.user).all()
+            for_user=request.user).order_by('-recommended_on', '-id')
+        page = self.paginate_queryset(recommendations)
         recommendations_serializer = self.serializer_class(
-            recommendations,
+            page,
             context={'request': request},
             many=True)
 
+        return self.get_paginated_response(recommendations_serializer.data)
+
+    @action(detail=False, url_path='unread-count', methods=['get'])
+    def unread_count(self, request, pk=None, **kwargs):
+        """Recommendations received after `?since=<recommendation id>`.
+
+        Clients poll this with the `latest` id of their previous call, it is
+        answered from the `for_user` index without loading any row.
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            raise ValidationError({'since': 'Must be a recommendation id.'})
+
+        inbox = Recommendation.objects.filter(
+            for_user=request.user, id__gt=since).aggregate(
+                count=Count('id'), latest=Max('id'))
+
         return Response(
             status=status.HTTP_200_OK,
-            data=recommendations_serializer.data)
+            data={'count': inbox['count'],
+                  'latest': inbox['latest'] or since})
+
+    @action(detail=False, url_path='bulk', methods=['post'])
+    @write_transaction()
+    def bulk_recommend(self, request, pk=None, **kwargs):
+        serializer = BulkRecommendationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pairs = {
+            tuple(sorted(item.items()))
+            for item in serializer.validated_data['recommendations']}
+        recommendations = [
+            Recommendation(
+                from_user=request.user,
+                **{('for_user_id' if name == 'user' else '%s_id' % name): pk
+                   for name, pk in pair})
+            for pair in pairs]
+        Recommendation.objects.bulk_create(recommendations, batch_size=500)
+        # Bulk inserts send no signal.
+        response_cache.invalidate_users(
+            recommendation.for_user_id for recommendation in recommendations)
 
+        return Response(
+            status=status.HTTP_201_CREATED,
+            data={'created': len(recommendations)})
 
-class AlbumViewSet(viewsets.ModelViewSet):
-    queryset = Album.objects.all().order_by('-released_on')
+
+class AlbumViewSet(CatalogReadsMixin, CatalogConditionalMixin,
+                   viewsets.ModelViewSet):
+    queryset = Album.objects.prefetch_related(
+        *prefetch_links(genres=Genre)).annotate(
+            total_length=total_length(
+                Song.objects, 'album', 'song_length')).order_by(
+                    '-released_on', '-id')
     serializer_class = AlbumSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticated]
+    shows_ratings = True
 
     def get_renderers(self):
         rends = [renderers.JSONRenderer]
@@ -160,6 +614,35 @@ class AlbumViewSet(viewsets.ModelViewSet):
 
         return [renderer() for renderer in rends]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if self.action == 'list':
+            queryset = AlbumListFilter(
+                self.request.query_params).filter(queryset)
+
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+
+        page = self.paginate_queryset(
+            AlbumFastSerializer.rows(self.get_queryset()))
+
+        return self.get_paginated_response(AlbumFastSerializer(
+            request, self.format_kwarg).serialize(page))
+
+    def retrieve(self, request, pk=None, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().retrieve(request, pk=pk, **kwargs)
+
+        row = generics.get_object_or_404(
+            AlbumFastSerializer.rows(self.queryset), id=pk)
+
+        return Response(AlbumFastSerializer(
+            request, self.format_kwarg).serialize([row])[0])
+
     def create(self, request, *args, **kwargs):
         raise MethodNotAllowed(request.method)
 
@@ -172,8 +655,25 @@ class AlbumViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         raise MethodNotAllowed(request.method)
 
+    @action(detail=True, url_path='rate-album', methods=['get', 'put'])
+    def rate_album(self, request, pk=None, **kwargs):
+        if request.method == 'PUT':
+            # A buffered rating is only written later, check the album now.
+            rated = generics.get_object_or_404(
+                Album.objects.only('id'), id=pk)
+            ratings.rate(Album, rated.pk, rating_from(request))
+
+        album = generics.get_object_or_404(self.queryset, id=pk)
+        album_serializer = self.serializer_class(
+            album,
+            context={'request': request})
+
+        return Response(
+            status=status.HTTP_202_ACCEPTED,
+            data=album_serializer.data)
+
     @action(detail=True, url_path='recommend-album', methods=['put'])
-    @transaction.atomic
+    @write_transaction()
     def recommend_album(self, request, pk=None, **kwargs):
         album = self.queryset.get(id=pk)
         resp_status = status.HTTP_200_OK
@@ -195,8 +695,12 @@ class AlbumViewSet(viewsets.ModelViewSet):
             data=album_serializer.data)
 
 
-class GenreViewSet(viewsets.ModelViewSet):
-    queryset = Genre.objects.all().order_by('id')
+class GenreViewSet(CatalogReadsMixin, CatalogConditionalMixin,
+                   SparseRelationsMixin,
+                   viewsets.ModelViewSet):
+    queryset = Genre.objects.prefetch_related(
+        *prefetch_links(songs=Song, albums=Album, artists=Artist)
+    ).order_by('id')
     serializer_class = GenreSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -220,8 +724,20 @@ class GenreViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         raise MethodNotAllowed(request.method)
 
+    @action(detail=True, methods=['get'])
+    def songs(self, request, pk=None, **kwargs):
+        return self.relation_page(pk, 'songs')
+
+    @action(detail=True, methods=['get'])
+    def albums(self, request, pk=None, **kwargs):
+        return self.relation_page(pk, 'albums')
+
+    @action(detail=True, methods=['get'])
+    def artists(self, request, pk=None, **kwargs):
+        return self.relation_page(pk, 'artists')
+
     @action(detail=True, url_path='recommend-genre', methods=['put'])
-    @transaction.atomic
+    @write_transaction()
     def recommend_genre(self, request, pk=None, **kwargs):
         genre = self.queryset.get(id=pk)
         resp_status = status.HTTP_200_OK
@@ -243,9 +759,14 @@ class GenreViewSet(viewsets.ModelViewSet):
             data=genre_serializer.data)
 
 
-class ArtistViewSet(viewsets.ModelViewSet):
-    queryset = Artist.objects.all().order_by('name')
+class ArtistViewSet(CatalogReadsMixin, CatalogConditionalMixin,
+                    SparseRelationsMixin,
+                    viewsets.ModelViewSet):
+    queryset = Artist.objects.prefetch_related(
+        *prefetch_links(albums=Album, songs=Song, genres=Genre)
+    ).order_by('name', 'id')
     serializer_class = ArtistSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_renderers(self):
@@ -268,8 +789,20 @@ class ArtistViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         raise MethodNotAllowed(request.method)
 
+    @action(detail=True, methods=['get'])
+    def albums(self, request, pk=None, **kwargs):
+        return self.relation_page(pk, 'albums')
+
+    @action(detail=True, methods=['get'])
+    def songs(self, request, pk=None, **kwargs):
+        return self.relation_page(pk, 'songs')
+
+    @action(detail=True, methods=['get'])
+    def genres(self, request, pk=None, **kwargs):
+        return self.relation_page(pk, 'genres')
+
     @action(detail=True, url_path='recommend-artist', methods=['put'])
-    @transaction.atomic
+    @write_transaction()
     def recommend_artist(self, request, pk=None, **kwargs):
         artist = self.queryset.get(id=pk)
         resp_status = status.HTTP_200_OK
@@ -291,10 +824,29 @@ class ArtistViewSet(viewsets.ModelViewSet):
             data=artist_serializer.data)
 
 
-class PlaylistViewSet(viewsets.ModelViewSet):
-    queryset = Playlist.objects.all().order_by('-created_on')
+class PlaylistViewSet(UserCacheMixin, viewsets.ModelViewSet):
+    # Song links in track order, the join of the prefetch is reused for it.
+    queryset = Playlist.objects.prefetch_related(Prefetch(
+        'songs', queryset=Song.objects.only('id').order_by(
+            'playlist_tracks__position', 'playlist_tracks__id'))).annotate(
+            total_length=total_length(
+                PlaylistTrack.objects, 'playlist',
+                'song__song_length')).order_by('-created_on')
     serializer_class = PlaylistSerializer
     permission_classes = [permissions.IsAuthenticated]
+    user_cached_actions = ('list', 'retrieve', 'tracks', 'suggestions')
+    # Suggested songs are rendered with their ratings.
+    rated_actions = ('suggestions',)
+
+    def cache_owner(self, request, pk=None):
+        if pk is None:
+            return request.user.id
+
+        try:
+            return Playlist.objects.filter(id=int(pk)).values_list(
+                'user_id', flat=True).first()
+        except ValueError:
+            return None
 
     def get_renderers(self):
         rends = [renderers.JSONRenderer]
@@ -305,47 +857,168 @@ class PlaylistViewSet(viewsets.ModelViewSet):
         return [renderer() for renderer in rends]
 
     def list(self, request):
-        playlists = self.queryset.filter(user=self.request.user).all()
-        playlists_serializer = self.serializer_class(
-            playlists,
+        # Counts the tracks instead of loading them, the detail and the
+        # tracks endpoints list them.
+        user_playlists = self.queryset.filter(
+            user=self.request.user).prefetch_related(None).annotate(
+                tracks_count=relation_count(Playlist, 'songs'))
+        page = self.paginate_queryset(user_playlists)
+        playlists_serializer = PlaylistListSerializer(
+            page,
             context={'request': request},
             many=True)
 
-        return Response(
-            status=status.HTTP_200_OK,
-            data=playlists_serializer.data)
+        return self.get_paginated_response(playlists_serializer.data)
 
-    @transaction.atomic
+    @write_transaction()
     def create(self, request, *args, **kwargs):
-        playlist_songs = Song.objects.filter(
-            id__in=request.data['songs']).all()
-        new_playlist = Playlist.objects.create(
-            name=request.data['name'],
-            user=request.user)
-        new_playlist.songs.set(playlist_songs)
-        new_playlist.save()
+        if request.data.get('rules') is not None:
+            new_playlist = Playlist.objects.create(
+                name=request.data['name'],
+                user=request.user,
+                rules=rules_from(request),
+                is_smart=True)
+            smart_playlists.materialize(new_playlist)
+        else:
+            song_ids = set(Song.objects.filter(
+                id__in=request.data['songs']).values_list('id', flat=True))
+            new_playlist = Playlist.objects.create(
+                name=request.data['name'],
+                user=request.user)
+            playlists.append_tracks(
+                new_playlist,
+                [int(pk) for pk in request.data['songs']
+                 if int(pk) in song_ids])
+
         playlist_serializer = self.serializer_class(
-            new_playlist,
+            self.queryset.get(id=new_playlist.id),
             context={'request': request})
 
         return Response(
             status=status.HTTP_201_CREATED,
             data=playlist_serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def tracks(self, request, pk=None, **kwargs):
+        playlist = get_object_or_404(Playlist.objects.only('id'), id=pk)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(
+            PlaylistTrack.objects.filter(playlist=playlist).select_related(
+                'song').only('song__name', 'position').order_by(
+                    'position', 'id'),
+            request,
+            view=self)
+        tracks_serializer = PlaylistTrackSerializer(
+            page,
+            context={'request': request},
+            many=True)
+
+        return paginator.get_paginated_response(tracks_serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def suggestions(self, request, pk=None, **kwargs):
+        playlist = get_object_or_404(Playlist.objects.only('id'), id=pk)
+
+        try:
+            limit = int(request.query_params.get(
+                'limit', suggestions.SUGGESTION_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+
+        scored = suggestions.suggest_for_playlist(
+            playlist,
+            limit=max(1, min(limit, suggestions.SUGGESTION_MAX_LIMIT)))
+        songs = SongViewSet.queryset.in_bulk([pk for pk, _ in scored])
+        scored = [(pk, score) for pk, score in scored if pk in songs]
+        results = SongSerializer(
+            [songs[pk] for pk, _ in scored],
+            context={'request': request},
+            many=True).data
+
+        for song_data, (_, score) in zip(results, scored):
+            song_data['score'] = round(score, 4)
+
+        return Response(
+            status=status.HTTP_200_OK,
+            data=results)
+
+    @action(detail=True, methods=['put'])
+    @write_transaction()
+    def rules(self, request, pk=None, **kwargs):
+        playlist = get_object_or_404(
+            Playlist.objects.only('id', 'rules', 'is_smart'), id=pk)
+        playlist.rules = rules_from(request)
+        playlist.is_smart = playlist.rules is not None
+        playlist.save(update_fields=['rules', 'is_smart'])
+        added, removed = [], []
+
+        if playlist.rules is not None:
+            added, removed = smart_playlists.materialize(playlist)
+
+        return Response(
+            status=status.HTTP_202_ACCEPTED,
+            data={
+                'rules': playlist.rules,
+                'added': [reverse('song-detail', args=[song_id],
+                                  request=request) for song_id in added],
+                'removed': [reverse('song-detail', args=[song_id],
+                                    request=request) for song_id in removed],
+            })
+
+    @action(detail=True, url_path='move-track', methods=['put'])
+    def move_track(self, request, pk=None, **kwargs):
+        playlist = get_object_or_404(Playlist.objects.only('id'), id=pk)
+        after = request.data.get('after')
+
+        try:
+            song_id = int(request.data['song'])
+            after = None if after is None else int(after)
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                {'song': 'Both song and after must be song ids.'})
+
+        try:
+            track = playlists.move_track(playlist, song_id, after)
+        except PlaylistTrack.DoesNotExist:
+            raise ValidationError(
+                {'song': 'Both song and after must be in the playlist.'})
+
+        return Response(
+            status=status.HTTP_202_ACCEPTED,
+            data=PlaylistTrackSerializer(
+                track, context={'request': request}).data)
+
+    @action(detail=True, url_path='edit-songs', methods=['put'])
+    @write_transaction()
+    def edit_songs(self, request, pk=None, **kwargs):
+        playlist = get_object_or_404(Playlist.objects.only('id'), id=pk)
+        serializer = PlaylistEditSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        added, removed = playlists.edit_tracks(
+            playlist,
+            add=serializer.validated_data['add'],
+            remove=serializer.validated_data['remove'])
+
+        return Response(
+            status=status.HTTP_202_ACCEPTED,
+            data={
+                'added': [reverse('song-detail', args=[song_id],
+                                  request=request) for song_id in added],
+                'removed': [reverse('song-detail', args=[song_id],
+                                    request=request) for song_id in removed],
+            })
+
     @action(detail=True, url_path='remove-song', methods=['get', 'put'])
-    @transaction.atomic
+    @write_transaction()
     def remove_song_from_playlist(self, request, pk=None, **kwargs):
         playlist = self.queryset.get(id=pk)
         resp_status = status.HTTP_200_OK
 
         if request.method == 'PUT':
-            songs = Song.objects.filter(
-                id__in=request.data['songs']).all()
-
-            for song in songs:
-                playlist.songs.remove(song)
-
-            playlist.save()
+            playlists.edit_tracks(
+                playlist,
+                remove=[int(song_id) for song_id in request.data['songs']])
+            playlist = self.queryset.get(id=pk)
 
             resp_status = status.HTTP_202_ACCEPTED
 
@@ -358,18 +1031,17 @@ class PlaylistViewSet(viewsets.ModelViewSet):
             data=playlist_serializer.data)
 
     @action(detail=True, url_path='add-song', methods=['get', 'put'])
-    @transaction.atomic
+    @write_transaction()
     def add_song_to_playlist(self, request, pk=None, **kwargs):
         playlist = self.queryset.get(id=pk)
         resp_status = status.HTTP_200_OK
 
         if request.method == 'PUT':
-            songs = Song.objects.filter(
-                id__in=request.data['songs']).all()
-
-            playlist.songs.set(playlist.songs.all() | songs)
+            song_ids = Song.objects.filter(
+                id__in=request.data['songs']).values_list('id', flat=True)
 
-            playlist.save()
+            playlists.append_tracks(playlist, list(song_ids))
+            playlist = self.queryset.get(id=pk)
 
             resp_status = status.HTTP_202_ACCEPTED
 
@@ -380,3 +1052,27 @@ class PlaylistViewSet(viewsets.ModelViewSet):
         return Response(
             status=resp_status,
             data=playlist_serializer.data)
+
+
+class ExportViewSet(viewsets.ViewSet):
+    """Streams the catalog, or the library of the requesting user, as
+    NDJSON in a single response, read in chunks with constant memory.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def stream(self, lines, filename):
+        response = StreamingHttpResponse(
+            lines, content_type=export.NDJSON_CONTENT_TYPE)
+        response['Content-Disposition'] = (
+            'attachment; filename="%s"' % filename)
+
+        return response
+
+    @action(detail=False, methods=['get'])
+    def catalog(self, request, **kwargs):
+        return self.stream(export.catalog_lines(), 'catalog.ndjson')
+
+    @action(detail=False, methods=['get'])
+    def library(self, request, **kwargs):
+        return self.stream(
+            export.library_lines(request.user), 'library.ndjson')